@@ -1,8 +1,17 @@
 import os
-import requests
-import pandas as pd
-from dash import Dash, dcc, html, Input, Output, State
-import plotly.express as px
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+# only Dash/Flask are imported up front: pandas, pyarrow and plotly.express
+# load with the data (see warm_up) so gunicorn binds and answers /healthz
+# within a second or two. `python profile_startup.py` shows where the
+# import time goes.
+from dash import Dash, dcc, html, Input, Output, State, ctx
+from flask import jsonify
+
+from export import register_export
 
 # ---------------------------
 # pastel palette
@@ -21,173 +30,75 @@ external_stylesheets = [
 
 
 # ===========================
-# 1) LOAD FULL MERGED DATA FROM GITHUB PARQUET
+# 1) DATA: LOCAL OR FROM THE DATA SERVICE (LOADED IN THE BACKGROUND)
 # ===========================
-
-LOCAL_PARQUET = "merged_final.parquet"
-
-def load_data():
-    # guaranteed local file load
-    if os.path.exists(LOCAL_PARQUET):
-        print("Loading full dataset from local merged_final.parquet ...")
-        df = pd.read_parquet(LOCAL_PARQUET)
-        print("Loaded parquet:", df.shape)
-        return df
+# DATA_SERVICE=grpc://host:8815 (or grpc+unix:///path.sock) makes this
+# worker a thin client of data_service.py instead of loading the parquet
+DATA_SERVICE = os.environ.get("DATA_SERVICE")
+
+# the data is loaded by a background thread; pages and /healthz are served
+# right away, callbacks wait in get_data() until it is there
+_ready = threading.Event()
+_warm_lock = threading.Lock()
+_warm = {"thread": None, "data": None, "error": None, "seconds": None}
+_started = time.perf_counter()
+WARMUP_MAX_DELAY = 30  # seconds between warm-up retries, at most
+
+
+def load_data_source():
+    if DATA_SERVICE:
+        from data_service import DataServiceClient
+
+        print("Using data service at", DATA_SERVICE)
+        data = DataServiceClient(DATA_SERVICE)
+        data.meta  # fails here (not on the first click) if it is down
     else:
-        raise FileNotFoundError(
-            "merged_final.parquet not found! Make sure it is included in your Space."
-        )
-
-df = load_data()
-# PARQUET_URL = "https://raw.githubusercontent.com/Salmakhaled204/nyc-collisions-w25/salma-parquet/merged_final.parquet"
-# LOCAL_PARQUET = "merged_final.parquet"
-# LOCAL_CSV = "sample_final.csv"  # this file is already in your Space repo
-
-# def load_data():
-#     # 1) try to read an existing local parquet file
-#     if os.path.exists(LOCAL_PARQUET):
-#         try:
-#             print("Trying local parquet...")
-#             df = pd.read_parquet(LOCAL_PARQUET)
-#             print("Loaded local parquet:", df.shape)
-#             return df
-#         except Exception as e:
-#             print("Failed to read local parquet, will try download:", e)
-
-#     # 2) try to download parquet from GitHub and read it
-#     try:
-#         print("Downloading merged_final.parquet from GitHub...")
-#         resp = requests.get(PARQUET_URL, timeout=60)
-#         resp.raise_for_status()
-#         with open(LOCAL_PARQUET, "wb") as f:
-#             f.write(resp.content)
-#         print("Download finished. Reading parquet...")
-#         df = pd.read_parquet(LOCAL_PARQUET)
-#         print("Loaded downloaded parquet:", df.shape)
-#         return df
-#     except Exception as e:
-#         print("Failed to download/read parquet, FALLING BACK to CSV:", e)
-
-#     # 3) fallback: use the CSV shipped with the Space
-#     print("Loading fallback CSV:", LOCAL_CSV)
-#     df = pd.read_csv(LOCAL_CSV)
-#     print("Loaded CSV:", df.shape)
-#     return df
-
-# # use this DataFrame everywhere in your app
-# df = load_data()
-
-# ===========================
-# 2) HELPER: GUESS COLUMN NAMES
-# ===========================
-def guess_col(df, candidates):
-    # exact match
-    for c in candidates:
-        if c in df.columns:
-            return c
-    # substring match (case-insensitive)
-    for col in df.columns:
-        for c in candidates:
-            if c.lower() in col.lower():
-                return col
-    return None
-
-
-collision_col = guess_col(df, ["collision_id"])
-borough_col = guess_col(df, ["borough"])
-year_col = guess_col(df, ["crash_year", "year"])
-date_crash_col = guess_col(df, ["crash_date_crash", "crash_date"])
-factor_col = guess_col(df, ["contributing_factor_vehicle_1", "contributing_factor"])
-vehicle_col = guess_col(df, ["vehicle_type_code_1", "vehicle_type"])
-age_col = guess_col(df, ["person_age_imputed", "person_age"])
-injury_col = guess_col(df, ["person_injury_clean", "person_injury"])
-lat_col = guess_col(df, ["latitude", "lat"])
-lon_col = guess_col(df, ["longitude", "lon", "long"])
-hour_col = guess_col(df, ["crash_hour", "hour"])
-weekday_col = guess_col(df, ["crash_weekday"])
-
-print("Detected columns:")
-for name, val in [
-    ("collision_col", collision_col),
-    ("borough_col", borough_col),
-    ("year_col", year_col),
-    ("date_crash_col", date_crash_col),
-    ("factor_col", factor_col),
-    ("vehicle_col", vehicle_col),
-    ("age_col", age_col),
-    ("injury_col", injury_col),
-    ("lat_col", lat_col),
-    ("lon_col", lon_col),
-    ("hour_col", hour_col),
-    ("weekday_col", weekday_col),
-]:
-    print(f" {name}: {val}")
-
-
-# ===========================
-# 3) FEATURE ENGINEERING
-# ===========================
-# date → year + weekday
-if date_crash_col is not None:
-    df[date_crash_col] = pd.to_datetime(df[date_crash_col], errors="coerce")
-
-    if year_col is None:
-        df["crash_year_tmp"] = df[date_crash_col].dt.year
-        year_col = "crash_year_tmp"
-
-    if weekday_col is None:
-        df["crash_weekday_tmp"] = df[date_crash_col].dt.day_name()
-        weekday_col = "crash_weekday_tmp"
-
-# age groups
-if age_col is not None:
-    df["age_group"] = pd.cut(
-        df[age_col],
-        bins=[0, 17, 30, 45, 60, 120],
-        labels=["<18", "18–30", "31–45", "46–60", "60+"],
-    )
-else:
-    df["age_group"] = "Unknown"
-
-# injury column clean
-if injury_col is not None:
-    df[injury_col] = df[injury_col].fillna("UNKNOWN")
-else:
-    injury_col = None
-
-# columns used for search
-search_cols = [
-    c
-    for c in [borough_col, factor_col, vehicle_col, injury_col, "age_group", year_col]
-    if c is not None
-]
-
-
-def unique_sorted(col):
-    if col is None:
-        return []
-    return sorted(df[col].dropna().unique())
-
-
-borough_options = unique_sorted(borough_col)
-year_options = unique_sorted(year_col)
-vehicle_options = unique_sorted(vehicle_col)
-factor_options = unique_sorted(factor_col)
-age_group_options = unique_sorted("age_group")
-
-print(
-    "Unique counts:",
-    "borough",
-    len(borough_options),
-    "year",
-    len(year_options),
-    "vehicle",
-    len(vehicle_options),
-    "factor",
-    len(factor_options),
-    "age_group",
-    len(age_group_options),
-)
+        from dataset import Dataset, load_data
+
+        data = Dataset(load_data())
+    # otherwise the first report pays for this import
+    import plotly.express  # noqa: F401
+
+    return data
+
+
+def warm_up():
+    # retried with backoff: with DATA_SERVICE the service is often still
+    # loading the parquet when the workers start
+    delay = 1
+    while True:
+        start = time.perf_counter()
+        try:
+            data = load_data_source()
+        except Exception as e:
+            _warm["error"] = f"{type(e).__name__}: {e}"
+            print(f"Data warm-up failed ({_warm['error']}), retrying in {delay}s")
+            # callbacks fail fast until a retry succeeds instead of hanging
+            _ready.set()
+            time.sleep(delay)
+            delay = min(delay * 2, WARMUP_MAX_DELAY)
+            continue
+        _warm["seconds"] = round(time.perf_counter() - start, 2)
+        _warm["data"], _warm["error"] = data, None
+        print(f"Data warm-up finished in {_warm['seconds']}s")
+        _ready.set()
+        return
+
+
+def start_warmup():
+    # once per process; under gunicorn it runs after the fork (gunicorn.conf.py)
+    with _warm_lock:
+        if _warm["thread"] is None:
+            _warm["thread"] = threading.Thread(target=warm_up, name="data-warmup", daemon=True)
+            _warm["thread"].start()
+
+
+def get_data():
+    start_warmup()
+    _ready.wait()
+    if _warm["data"] is None:
+        raise RuntimeError(f"data not loaded yet ({_warm['error']}), retrying")
+    return _warm["data"]
 
 
 # ===========================
@@ -206,471 +117,666 @@ def style_fig(fig):
 
 
 # ===========================
-# 4) DASH APP LAYOUT
+# 3) DASH APP LAYOUT
 # ===========================
 app = Dash(__name__, external_stylesheets=external_stylesheets)
 server = app.server
 
-app.layout = html.Div(
-    style={
-        "backgroundColor": PAGE_BG,
-        "minHeight": "100vh",
-        "padding": "22px 0",
-        "fontFamily": "'Segoe UI', system-ui, -apple-system, BlinkMacSystemFont, sans-serif",
-    },
-    children=[
-        html.Div(
-            className="container",
-            children=[
-                # HEADER
-                html.Div(
-                    className="d-flex flex-column flex-md-row align-items-md-center justify-content-between mb-3",
-                    children=[
-                        html.Div(
-                            children=[
-                                html.H1(
-                                    "NYC Motor Vehicle Collisions — Interactive Dashboard",
-                                    style={
-                                        "fontWeight": "700",
-                                        "fontSize": "28px",
-                                        "marginBottom": "0.25rem",
-                                        "color": DEEP_INDIGO,
-                                    },
-                                ),
-                                html.P(
-                                    "Soft pastel view of crashes by borough, time, vehicles, and factors.",
-                                    style={
-                                        "color": "#7b6f9e",
-                                        "marginBottom": "0",
-                                        "fontSize": "14px",
-                                    },
-                                ),
-                            ]
-                        ),
-                    ],
-                ),
-
-                # FILTER CARD
-                html.Div(
-                    className="card shadow-sm mb-3",
-                    style={
-                        "borderRadius": "16px",
-                        "border": f"1px solid {PASTEL_PINK}33",
-                    },
-                    children=[
-                        html.Div(
-                            className="card-body",
-                            children=[
-                                html.H5(
-                                    "Filters",
-                                    className="card-title",
-                                    style={
-                                        "fontSize": "16px",
-                                        "fontWeight": "600",
-                                        "color": DEEP_INDIGO,
-                                    },
-                                ),
-                                html.Div(
-                                    className="row g-2",
-                                    children=[
-                                        html.Div(
-                                            className="col-md-3 col-sm-6",
-                                            children=[
-                                                html.Label(
-                                                    "Borough",
-                                                    className="form-label mb-1",
-                                                ),
-                                                dcc.Dropdown(
-                                                    id="filter-borough",
-                                                    options=[
-                                                        {"label": b, "value": b}
-                                                        for b in borough_options
-                                                    ],
-                                                    value=[],
-                                                    multi=True,
-                                                    placeholder="All boroughs",
-                                                ),
-                                            ],
-                                        ),
-                                        html.Div(
-                                            className="col-md-3 col-sm-6",
-                                            children=[
-                                                html.Label(
-                                                    "Year",
-                                                    className="form-label mb-1",
-                                                ),
-                                                dcc.Dropdown(
-                                                    id="filter-year",
-                                                    options=[
-                                                        {"label": str(int(y)), "value": y}
-                                                        for y in year_options
-                                                    ],
-                                                    value=[],
-                                                    multi=True,
-                                                    placeholder="All years",
-                                                ),
-                                            ],
-                                        ),
-                                        html.Div(
-                                            className="col-md-3 col-sm-6",
-                                            children=[
-                                                html.Label(
-                                                    "Vehicle Type",
-                                                    className="form-label mb-1",
-                                                ),
-                                                dcc.Dropdown(
-                                                    id="filter-vehicle",
-                                                    options=[
-                                                        {"label": v, "value": v}
-                                                        for v in vehicle_options
-                                                    ],
-                                                    value=[],
-                                                    multi=True,
-                                                    placeholder="All vehicle types",
-                                                ),
-                                            ],
-                                        ),
-                                        html.Div(
-                                            className="col-md-3 col-sm-6",
-                                            children=[
-                                                html.Label(
-                                                    "Contributing Factor",
-                                                    className="form-label mb-1",
-                                                ),
-                                                dcc.Dropdown(
-                                                    id="filter-factor",
-                                                    options=[
-                                                        {"label": f, "value": f}
-                                                        for f in factor_options
-                                                    ],
-                                                    value=[],
-                                                    multi=True,
-                                                    placeholder="All factors",
-                                                ),
-                                            ],
-                                        ),
-                                        html.Div(
-                                            className="col-md-3 col-sm-6 mt-2",
-                                            children=[
-                                                html.Label(
-                                                    "Age Group",
-                                                    className="form-label mb-1",
-                                                ),
-                                                dcc.Dropdown(
-                                                    id="filter-age-group",
-                                                    options=[
-                                                        {"label": str(a), "value": str(a)}
-                                                        for a in age_group_options
-                                                    ],
-                                                    value=[],
-                                                    multi=True,
-                                                    placeholder="All ages",
-                                                ),
-                                            ],
-                                        ),
-                                    ],
-                                ),
-                            ],
-                        )
-                    ],
-                ),
-
-                # SEARCH + BUTTON CARD
-                html.Div(
-                    className="card shadow-sm mb-3",
-                    style={
-                        "borderRadius": "16px",
-                        "border": f"1px solid {PASTEL_BLUE}33",
-                    },
-                    children=[
-                        html.Div(
-                            className="card-body",
-                            children=[
-                                html.Div(
-                                    className="row g-2 align-items-center",
-                                    children=[
-                                        html.Div(
-                                            className="col-md-10",
-                                            children=[
-                                                html.Label(
-                                                    "Search mode (e.g. 'Brooklyn 2022 pedestrian')",
-                                                    className="form-label mb-1",
-                                                ),
-                                                dcc.Input(
-                                                    id="search-box",
-                                                    type="text",
-                                                    placeholder="Type keyword(s) and click Generate Report…",
-                                                    style={
-                                                        "width": "100%",
-                                                        "padding": "8px 10px",
-                                                        "borderRadius": "999px",
-                                                        "border": "1px solid #d0cde8",
-                                                        "backgroundColor": "#fdfbff",
-                                                    },
-                                                ),
-                                            ],
-                                        ),
-                                        html.Div(
-                                            className="col-md-2 d-grid",
-                                            style={"marginTop": "26px"},
-                                            children=[
-                                                html.Button(
-                                                    "Generate Report",
-                                                    id="btn-generate",
-                                                    n_clicks=0,
-                                                    className="btn",
-                                                    style={
-                                                        "fontWeight": "600",
-                                                        "height": "40px",
-                                                        "borderRadius": "999px",
-                                                        "border": "none",
-                                                        "backgroundImage": f"linear-gradient(90deg,{PASTEL_PINK},{PASTEL_BLUE})",
-                                                        "color": "white",
-                                                        "boxShadow": "0 4px 10px rgba(0,0,0,0.12)",
-                                                    },
-                                                )
-                                            ],
-                                        ),
-                                    ],
-                                ),
-                            ],
-                        )
-                    ],
-                ),
-
-                # KPI CARD
-                html.Div(
-                    id="kpi-card",
-                    className="shadow-sm mb-3",
-                    style={
-                        "borderRadius": "16px",
-                        "border": f"1px solid {PASTEL_MINT}66",
-                        "background": "#ffffff",
-                        "padding": "10px 16px",
-                        "fontWeight": "500",
-                        "fontSize": "14px",
-                        "color": DEEP_INDIGO,
-                    },
-                ),
-
-                # TOP ROW GRAPHS
-                html.Div(
-                    className="row g-3 mb-3",
-                    children=[
-                        html.Div(
-                            className="col-md-6",
-                            children=[
-                                html.Div(
-                                    className="card shadow-sm h-100",
-                                    style={"borderRadius": "18px"},
-                                    children=[
-                                        html.Div(
-                                            className="card-body",
-                                            children=[
-                                                dcc.Graph(
-                                                    id="bar-borough",
-                                                    config={"displayModeBar": False},
-                                                )
-                                            ],
-                                        )
-                                    ],
-                                )
-                            ],
-                        ),
-                        html.Div(
-                            className="col-md-6",
-                            children=[
-                                html.Div(
-                                    className="card shadow-sm h-100",
-                                    style={"borderRadius": "18px"},
-                                    children=[
-                                        html.Div(
-                                            className="card-body",
-                                            children=[
-                                                dcc.Graph(
-                                                    id="line-year",
-                                                    config={"displayModeBar": False},
-                                                )
-                                            ],
-                                        )
-                                    ],
-                                )
-                            ],
-                        ),
-                    ],
-                ),
-
-                # MIDDLE ROW (heatmap + map)
-                html.Div(
-                    className="row g-3 mb-3",
-                    children=[
-                        html.Div(
-                            className="col-md-6",
-                            children=[
-                                html.Div(
-                                    className="card shadow-sm h-100",
-                                    style={"borderRadius": "18px"},
-                                    children=[
-                                        html.Div(
-                                            className="card-body",
-                                            children=[
-                                                dcc.Graph(
-                                                    id="heatmap-hour-weekday",
-                                                    config={"displayModeBar": False},
-                                                )
-                                            ],
-                                        )
-                                    ],
-                                )
-                            ],
-                        ),
-                        html.Div(
-                            className="col-md-6",
-                            children=[
-                                html.Div(
-                                    className="card shadow-sm h-100",
-                                    style={"borderRadius": "18px"},
-                                    children=[
-                                        html.Div(
-                                            className="card-body",
-                                            children=[
-                                                dcc.Graph(
-                                                    id="map-crashes",
-                                                    config={"displayModeBar": True},
-                                                )
-                                            ],
-                                        )
-                                    ],
-                                )
-                            ],
-                        ),
-                    ],
-                ),
-
-                # BOTTOM ROW (pie)
-                html.Div(
-                    className="row g-3 mb-4",
-                    children=[
-                        html.Div(
-                            className="col-md-6",
-                            children=[
-                                html.Div(
-                                    className="card shadow-sm h-100",
-                                    style={"borderRadius": "18px"},
-                                    children=[
-                                        html.Div(
-                                            className="card-body",
-                                            children=[
-                                                dcc.Graph(
-                                                    id="pie-injury",
-                                                    config={"displayModeBar": False},
-                                                )
-                                            ],
-                                        )
-                                    ],
-                                )
-                            ],
-                        ),
-                    ],
-                ),
-            ],
+# /export streams the rows behind the current report (parquet or csv)
+register_export(server, get_data)
+
+
+@server.route("/healthz")
+def healthz():
+    # liveness: the process is up, whether or not the data is loaded
+    return jsonify(status="ok", uptime=round(time.perf_counter() - _started, 2))
+
+
+@server.route("/readyz")
+def readyz():
+    # readiness: 200 once the data is loaded, 503 while warming (or while
+    # a failed warm-up is being retried)
+    start_warmup()
+    if _warm["data"] is not None:
+        return jsonify(status="ready", warmup_seconds=_warm["seconds"])
+    status = "retrying" if _warm["error"] else "warming"
+    return jsonify(status=status, error=_warm["error"]), 503
+
+
+def serve_layout():
+    # built per page load; the dropdown options are filled in by
+    # update_facet_counts, so nothing here needs the data
+    return html.Div(
+        style={
+            "backgroundColor": PAGE_BG,
+            "minHeight": "100vh",
+            "padding": "22px 0",
+            "fontFamily": "'Segoe UI', system-ui, -apple-system, BlinkMacSystemFont, sans-serif",
+        },
+        children=[
+            # per-tab session id (keys the incremental filter cache) and
+            # the active chart selections used for cross-filtering
+            dcc.Store(id="session-id", storage_type="session"),
+            dcc.Store(id="cross-filter", data={}),
+            html.Div(
+                className="container",
+                children=[
+                    # HEADER
+                    html.Div(
+                        className="d-flex flex-column flex-md-row align-items-md-center justify-content-between mb-3",
+                        children=[
+                            html.Div(
+                                children=[
+                                    html.H1(
+                                        "NYC Motor Vehicle Collisions — Interactive Dashboard",
+                                        style={
+                                            "fontWeight": "700",
+                                            "fontSize": "28px",
+                                            "marginBottom": "0.25rem",
+                                            "color": DEEP_INDIGO,
+                                        },
+                                    ),
+                                    html.P(
+                                        "Soft pastel view of crashes by borough, time, vehicles, and factors.",
+                                        style={
+                                            "color": "#7b6f9e",
+                                            "marginBottom": "0",
+                                            "fontSize": "14px",
+                                        },
+                                    ),
+                                ]
+                            ),
+                        ],
+                    ),
+
+                    # FILTER CARD
+                    html.Div(
+                        className="card shadow-sm mb-3",
+                        style={
+                            "borderRadius": "16px",
+                            "border": f"1px solid {PASTEL_PINK}33",
+                        },
+                        children=[
+                            html.Div(
+                                className="card-body",
+                                children=[
+                                    html.H5(
+                                        "Filters",
+                                        className="card-title",
+                                        style={
+                                            "fontSize": "16px",
+                                            "fontWeight": "600",
+                                            "color": DEEP_INDIGO,
+                                        },
+                                    ),
+                                    html.Div(
+                                        className="row g-2",
+                                        children=[
+                                            html.Div(
+                                                className="col-md-3 col-sm-6",
+                                                children=[
+                                                    html.Label(
+                                                        "Borough",
+                                                        className="form-label mb-1",
+                                                    ),
+                                                    dcc.Dropdown(
+                                                        id="filter-borough",
+                                                        options=[],
+                                                        value=[],
+                                                        multi=True,
+                                                        placeholder="All boroughs",
+                                                    ),
+                                                ],
+                                            ),
+                                            html.Div(
+                                                className="col-md-3 col-sm-6",
+                                                children=[
+                                                    html.Label(
+                                                        "Year",
+                                                        className="form-label mb-1",
+                                                    ),
+                                                    dcc.Dropdown(
+                                                        id="filter-year",
+                                                        options=[],
+                                                        value=[],
+                                                        multi=True,
+                                                        placeholder="All years",
+                                                    ),
+                                                ],
+                                            ),
+                                            html.Div(
+                                                className="col-md-3 col-sm-6",
+                                                children=[
+                                                    html.Label(
+                                                        "Vehicle Type",
+                                                        className="form-label mb-1",
+                                                    ),
+                                                    dcc.Dropdown(
+                                                        id="filter-vehicle",
+                                                        options=[],
+                                                        value=[],
+                                                        multi=True,
+                                                        placeholder="All vehicle types",
+                                                    ),
+                                                ],
+                                            ),
+                                            html.Div(
+                                                className="col-md-3 col-sm-6",
+                                                children=[
+                                                    html.Label(
+                                                        "Contributing Factor",
+                                                        className="form-label mb-1",
+                                                    ),
+                                                    dcc.Dropdown(
+                                                        id="filter-factor",
+                                                        options=[],
+                                                        value=[],
+                                                        multi=True,
+                                                        placeholder="All factors",
+                                                    ),
+                                                ],
+                                            ),
+                                            html.Div(
+                                                className="col-md-3 col-sm-6 mt-2",
+                                                children=[
+                                                    html.Label(
+                                                        "Age Group",
+                                                        className="form-label mb-1",
+                                                    ),
+                                                    dcc.Dropdown(
+                                                        id="filter-age-group",
+                                                        options=[],
+                                                        value=[],
+                                                        multi=True,
+                                                        placeholder="All ages",
+                                                    ),
+                                                ],
+                                            ),
+                                        ],
+                                    ),
+                                ],
+                            )
+                        ],
+                    ),
+
+                    # SEARCH + BUTTON CARD
+                    html.Div(
+                        className="card shadow-sm mb-3",
+                        style={
+                            "borderRadius": "16px",
+                            "border": f"1px solid {PASTEL_BLUE}33",
+                        },
+                        children=[
+                            html.Div(
+                                className="card-body",
+                                children=[
+                                    html.Div(
+                                        className="row g-2 align-items-center",
+                                        children=[
+                                            html.Div(
+                                                className="col-md-10",
+                                                children=[
+                                                    html.Label(
+                                                        "Search mode (e.g. 'Brooklyn 2022 pedestrian' — borough, year, vehicle, factor, injury and age-group names become filters, other words are searched as text)",
+                                                        className="form-label mb-1",
+                                                    ),
+                                                    dcc.Input(
+                                                        id="search-box",
+                                                        type="text",
+                                                        debounce=True,
+                                                        placeholder="Type keyword(s) and click Generate Report…",
+                                                        style={
+                                                            "width": "100%",
+                                                            "padding": "8px 10px",
+                                                            "borderRadius": "999px",
+                                                            "border": "1px solid #d0cde8",
+                                                            "backgroundColor": "#fdfbff",
+                                                        },
+                                                    ),
+                                                ],
+                                            ),
+                                            html.Div(
+                                                className="col-md-2 d-grid",
+                                                style={"marginTop": "26px"},
+                                                children=[
+                                                    html.Button(
+                                                        "Generate Report",
+                                                        id="btn-generate",
+                                                        n_clicks=0,
+                                                        className="btn",
+                                                        style={
+                                                            "fontWeight": "600",
+                                                            "height": "40px",
+                                                            "borderRadius": "999px",
+                                                            "border": "none",
+                                                            "backgroundImage": f"linear-gradient(90deg,{PASTEL_PINK},{PASTEL_BLUE})",
+                                                            "color": "white",
+                                                            "boxShadow": "0 4px 10px rgba(0,0,0,0.12)",
+                                                        },
+                                                    )
+                                                ],
+                                            ),
+                                        ],
+                                    ),
+                                    html.Div(
+                                        className="d-flex align-items-center justify-content-between mt-2",
+                                        children=[
+                                            html.Small(
+                                                "Tip: click a bar, heatmap cell or pie slice to filter the other charts.",
+                                                style={"color": "#7b6f9e"},
+                                            ),
+                                            html.Div(
+                                                children=[
+                                                    html.A(
+                                                        "Export rows (CSV)",
+                                                        id="export-csv",
+                                                        href="/export?format=csv",
+                                                        className="btn btn-sm btn-outline-secondary me-2",
+                                                        style={"borderRadius": "999px"},
+                                                    ),
+                                                    html.A(
+                                                        "Export rows (Parquet)",
+                                                        id="export-parquet",
+                                                        href="/export?format=parquet",
+                                                        className="btn btn-sm btn-outline-secondary me-2",
+                                                        style={"borderRadius": "999px"},
+                                                    ),
+                                                    html.Button(
+                                                        "Clear chart selection",
+                                                        id="btn-clear-cross",
+                                                        n_clicks=0,
+                                                        className="btn btn-sm btn-outline-secondary",
+                                                        style={"borderRadius": "999px"},
+                                                    ),
+                                                ],
+                                            ),
+                                        ],
+                                    ),
+                                ],
+                            )
+                        ],
+                    ),
+
+                    # KPI CARD
+                    html.Div(
+                        id="kpi-card",
+                        className="shadow-sm mb-3",
+                        style={
+                            "borderRadius": "16px",
+                            "border": f"1px solid {PASTEL_MINT}66",
+                            "background": "#ffffff",
+                            "padding": "10px 16px",
+                            "fontWeight": "500",
+                            "fontSize": "14px",
+                            "color": DEEP_INDIGO,
+                        },
+                    ),
+
+                    # TOP ROW GRAPHS
+                    html.Div(
+                        className="row g-3 mb-3",
+                        children=[
+                            html.Div(
+                                className="col-md-6",
+                                children=[
+                                    html.Div(
+                                        className="card shadow-sm h-100",
+                                        style={"borderRadius": "18px"},
+                                        children=[
+                                            html.Div(
+                                                className="card-body",
+                                                children=[
+                                                    dcc.Graph(
+                                                        id="bar-borough",
+                                                        config={"displayModeBar": False},
+                                                    )
+                                                ],
+                                            )
+                                        ],
+                                    )
+                                ],
+                            ),
+                            html.Div(
+                                className="col-md-6",
+                                children=[
+                                    html.Div(
+                                        className="card shadow-sm h-100",
+                                        style={"borderRadius": "18px"},
+                                        children=[
+                                            html.Div(
+                                                className="card-body",
+                                                children=[
+                                                    html.Div(
+                                                        className="d-flex align-items-center justify-content-between",
+                                                        children=[
+                                                            dcc.RadioItems(
+                                                                id="time-level",
+                                                                options=[
+                                                                    {"label": " Year", "value": "year"},
+                                                                    {"label": " Month", "value": "month"},
+                                                                    {"label": " Week", "value": "week"},
+                                                                    {"label": " Day", "value": "day"},
+                                                                ],
+                                                                value="year",
+                                                                inline=True,
+                                                                inputStyle={"marginLeft": "10px"},
+                                                                style={"fontSize": "13px", "color": DEEP_INDIGO},
+                                                            ),
+                                                            html.Button(
+                                                                "Reset time view",
+                                                                id="btn-reset-time",
+                                                                n_clicks=0,
+                                                                className="btn btn-sm btn-outline-secondary",
+                                                                style={"borderRadius": "999px"},
+                                                            ),
+                                                        ],
+                                                    ),
+                                                    # [start, end) drilled into on the chart
+                                                    dcc.Store(id="time-window", data=None),
+                                                    dcc.Graph(
+                                                        id="line-year",
+                                                        config={"displayModeBar": False},
+                                                    ),
+                                                ],
+                                            )
+                                        ],
+                                    )
+                                ],
+                            ),
+                        ],
+                    ),
+
+                    # MIDDLE ROW (heatmap + map)
+                    html.Div(
+                        className="row g-3 mb-3",
+                        children=[
+                            html.Div(
+                                className="col-md-6",
+                                children=[
+                                    html.Div(
+                                        className="card shadow-sm h-100",
+                                        style={"borderRadius": "18px"},
+                                        children=[
+                                            html.Div(
+                                                className="card-body",
+                                                children=[
+                                                    dcc.Graph(
+                                                        id="heatmap-hour-weekday",
+                                                        config={"displayModeBar": False},
+                                                    )
+                                                ],
+                                            )
+                                        ],
+                                    )
+                                ],
+                            ),
+                            html.Div(
+                                className="col-md-6",
+                                children=[
+                                    html.Div(
+                                        className="card shadow-sm h-100",
+                                        style={"borderRadius": "18px"},
+                                        children=[
+                                            html.Div(
+                                                className="card-body",
+                                                children=[
+                                                    dcc.Graph(
+                                                        id="map-crashes",
+                                                        config={"displayModeBar": True},
+                                                    )
+                                                ],
+                                            )
+                                        ],
+                                    )
+                                ],
+                            ),
+                        ],
+                    ),
+
+                    # BOTTOM ROW (pie)
+                    html.Div(
+                        className="row g-3 mb-4",
+                        children=[
+                            html.Div(
+                                className="col-md-6",
+                                children=[
+                                    html.Div(
+                                        className="card shadow-sm h-100",
+                                        style={"borderRadius": "18px"},
+                                        children=[
+                                            html.Div(
+                                                className="card-body",
+                                                children=[
+                                                    dcc.Graph(
+                                                        id="pie-injury",
+                                                        config={"displayModeBar": False},
+                                                    )
+                                                ],
+                                            )
+                                        ],
+                                    )
+                                ],
+                            ),
+                        ],
+                    ),
+                ],
+            )
+        ],
+    )
+
+
+app.layout = serve_layout
+
+
+# ===========================
+# 4) CALLBACK: LIVE FACET COUNTS ON DROPDOWNS
+# ===========================
+# (dimension, dropdown id, meta key with its values, label format)
+FACET_DROPDOWNS = [
+    ("borough", "filter-borough", "borough_options", str),
+    ("year", "filter-year", "year_options", lambda y: str(int(y))),
+    ("vehicle", "filter-vehicle", "vehicle_options", str),
+    ("factor", "filter-factor", "factor_options", str),
+    ("age_group", "filter-age-group", "age_group_options", str),
+]
+
+
+def options_with_counts(values, counts, selected, fmt):
+    # options that would return nothing are disabled (unless already picked)
+    options = []
+    for v in values:
+        n = counts.get(v, 0)
+        options.append(
+            {
+                "label": f"{fmt(v)} ({n:,})",
+                "value": v,
+                "disabled": n == 0 and v not in selected,
+            }
         )
-    ],
+    return options
+
+
+@app.callback(
+    [Output(dropdown_id, "options") for _, dropdown_id, _, _ in FACET_DROPDOWNS],
+    [Input(dropdown_id, "value") for _, dropdown_id, _, _ in FACET_DROPDOWNS],
+    Input("search-box", "value"),
+    Input("cross-filter", "data"),
 )
+def update_facet_counts(*args):
+    selected = dict(zip([d for d, _, _, _ in FACET_DROPDOWNS], args[:-2]))
+    selected = {d: v or [] for d, v in selected.items()}
+    data = get_data()
+    # chart selections narrow the counts exactly like they narrow the report
+    counts = data.facet_counts(selected, args[-2] or "", list(selected), args[-1] or {})
+    counts = {d: dict(zip(c["values"], c["counts"])) for d, c in counts.items()}
+
+    return [
+        options_with_counts(data.meta[key], counts.get(dim, {}), selected[dim], fmt)
+        for dim, _, key, fmt in FACET_DROPDOWNS
+    ]
 
 
 # ===========================
-# 5) CALLBACK: GENERATE REPORT
+# 5) CALLBACK: EXPORT LINKS FOLLOW THE FILTERS
+# ===========================
+@app.callback(
+    Output("export-csv", "href"),
+    Output("export-parquet", "href"),
+    [Input(dropdown_id, "value") for _, dropdown_id, _, _ in FACET_DROPDOWNS],
+    Input("search-box", "value"),
+    Input("cross-filter", "data"),
+)
+def update_export_links(*args):
+    params = {}
+    for (dim, _, _, fmt), values in zip(FACET_DROPDOWNS, args[:-2]):
+        if values:
+            params[dim] = [fmt(v) for v in values]
+    # chart selections narrow the dropdown ones, exactly like the report
+    for dim, values in (args[-1] or {}).items():
+        values = [str(v) for v in values]
+        if dim in params:
+            values = [v for v in params[dim] if v in values] or ["__none__"]
+        params[dim] = values
+    if args[-2]:
+        params["search"] = args[-2]
+
+    return (
+        "/export?" + urlencode({**params, "format": "csv"}, doseq=True),
+        "/export?" + urlencode({**params, "format": "parquet"}, doseq=True),
+    )
+
+
+# ===========================
+# 6) CALLBACK: CHART CLICKS -> CROSS-FILTER
+# ===========================
+def toggle(selection, dim, value):
+    # clicking the same element again removes it
+    values = selection.get(dim, [])
+    if value in values:
+        values = [v for v in values if v != value]
+    else:
+        values = values + [value]
+    if values:
+        selection[dim] = values
+    else:
+        selection.pop(dim, None)
+
+
+@app.callback(
+    Output("cross-filter", "data"),
+    Input("bar-borough", "clickData"),
+    Input("heatmap-hour-weekday", "clickData"),
+    Input("pie-injury", "clickData"),
+    Input("btn-clear-cross", "n_clicks"),
+    State("cross-filter", "data"),
+)
+def update_cross_filter(bar_click, heatmap_click, pie_click, clear_clicks, selection):
+    selection = dict(selection or {})
+    trigger = ctx.triggered_id
+
+    if trigger == "btn-clear-cross":
+        return {}
+    if trigger == "bar-borough" and bar_click:
+        toggle(selection, "borough", bar_click["points"][0]["x"])
+    elif trigger == "heatmap-hour-weekday" and heatmap_click:
+        point = heatmap_click["points"][0]
+        # a heatmap cell is one (weekday, hour) pair
+        if selection.get("weekday") == [point["y"]] and selection.get("hour") == [point["x"]]:
+            selection.pop("weekday", None)
+            selection.pop("hour", None)
+        else:
+            selection["weekday"] = [point["y"]]
+            selection["hour"] = [point["x"]]
+    elif trigger == "pie-injury" and pie_click:
+        toggle(selection, "injury", pie_click["points"][0]["label"])
+    return selection
+
+
+# ===========================
+# 7) CALLBACK: GENERATE REPORT
 # ===========================
 @app.callback(
     [
         Output("bar-borough", "figure"),
-        Output("line-year", "figure"),
         Output("heatmap-hour-weekday", "figure"),
         Output("map-crashes", "figure"),
         Output("pie-injury", "figure"),
         Output("kpi-card", "children"),
+        Output("session-id", "data"),
     ],
     Input("btn-generate", "n_clicks"),
+    Input("cross-filter", "data"),
     State("filter-borough", "value"),
     State("filter-year", "value"),
     State("filter-vehicle", "value"),
     State("filter-factor", "value"),
     State("filter-age-group", "value"),
     State("search-box", "value"),
+    State("session-id", "data"),
 )
 def update_dashboard(
     n_clicks,
+    cross_sel,
     borough_sel,
     year_sel,
     vehicle_sel,
     factor_sel,
     age_group_sel,
     search_text,
+    session_id,
 ):
+    import plotly.express as px
 
-    # start with all rows
-    mask = pd.Series(True, index=df.index)
-
-    borough_sel = borough_sel or []
-    year_sel = year_sel or []
-    vehicle_sel = vehicle_sel or []
-    factor_sel = factor_sel or []
-    age_group_sel = age_group_sel or []
+    session_id = session_id or uuid.uuid4().hex
+    cross_sel = cross_sel or {}
     search_text = (search_text or "").strip()
-
-    # dropdown filters
-    if borough_col and borough_sel:
-        mask &= df[borough_col].isin(borough_sel)
-    if year_col and year_sel:
-        mask &= df[year_col].isin(year_sel)
-    if vehicle_col and vehicle_sel:
-        mask &= df[vehicle_col].isin(vehicle_sel)
-    if factor_col and factor_sel:
-        mask &= df[factor_col].isin(factor_sel)
-    if age_group_sel:
-        mask &= df["age_group"].astype(str).isin(age_group_sel)
-
-    # keyword search
-    if search_text:
-        tokens = search_text.split()
-        search_mask = pd.Series(False, index=df.index)
-        for token in tokens:
-            token_mask = pd.Series(False, index=df.index)
-            for col in search_cols:
-                token_mask |= df[col].astype(str).str.contains(
-                    token, case=False, na=False
-                )
-            search_mask |= token_mask
-        mask &= search_mask
+    data = get_data()
+    meta = data.meta
+    collision_col = meta["collision_col"]
+    borough_col = meta["borough_col"]
+    factor_col = meta["factor_col"]
+    age_col = meta["age_col"]
+    injury_col = meta["injury_col"]
+    lat_col = meta["lat_col"]
+    lon_col = meta["lon_col"]
+    hour_col = meta["hour_col"]
+    weekday_col = meta["weekday_col"]
+
+    # dropdown filters + keyword search, refined from this session's
+    # previous result where possible; the charts get small aggregates
+    report = data.chart_data(
+        session_id,
+        {
+            "borough": borough_sel or [],
+            "year": year_sel or [],
+            "vehicle": vehicle_sel or [],
+            "factor": factor_sel or [],
+            "age_group": age_group_sel or [],
+        },
+        search_text,
+        cross_sel,
+    )
 
     print(
-        f"[DEBUG] n_clicks={n_clicks}, search='{search_text}', rows_after_mask={mask.sum()}"
+        f"[DEBUG] n_clicks={n_clicks}, search='{search_text}', "
+        f"rows_after_mask={report['n_rows']}, mode={report['mode']}, cross={cross_sel}"
     )
 
-    dff = df[mask]
-
-    if dff.empty:
+    if report["n_rows"] == 0:
         empty_fig = style_fig(px.bar(title="No data for selected filters / search"))
         return (
-            empty_fig,
             empty_fig,
             style_fig(px.imshow([[0]], title="No data")),
             style_fig(px.scatter_mapbox(lat=[], lon=[])),
             style_fig(px.pie(values=[1], names=["No data"])),
             "No data for the selected filters and search query.",
+            session_id,
         )
 
     # 1) Bar – crashes per borough
     if borough_col:
-        borough_counts = (
-            dff.groupby(borough_col)[collision_col]
-            .nunique()
-            .reset_index(name="crash_count")
-            .sort_values("crash_count", ascending=False)
-        )
         bar_fig = px.bar(
-            borough_counts,
+            report["borough_counts"],
             x=borough_col,
             y="crash_count",
             title="Number of Crashes per Borough",
@@ -680,40 +786,13 @@ def update_dashboard(
     else:
         bar_fig = style_fig(px.bar(title="Borough column not found"))
 
-    # 2) Line – crashes over time
-    if year_col:
-        yearly_counts = (
-            dff.groupby(year_col)[collision_col]
-            .nunique()
-            .reset_index(name="crash_count")
-            .sort_values(year_col)
-        )
-        line_fig = px.line(
-            yearly_counts,
-            x=year_col,
-            y="crash_count",
-            markers=True,
-            title="Crashes Over Time",
-        )
-        line_fig.update_traces(
-            line=dict(color=PASTEL_BLUE, width=3),
-            marker=dict(color=PASTEL_BLUE, size=6),
-        )
-        line_fig = style_fig(line_fig)
-    else:
-        line_fig = style_fig(px.line(title="Year column not found"))
-
-    # 3) Heatmap – hour vs weekday
+    # 2) Heatmap – hour vs weekday
     if hour_col and weekday_col:
-        tmp = dff.dropna(subset=[hour_col, weekday_col])
-        if not tmp.empty:
-            pivot = tmp.pivot_table(
-                index=weekday_col,
-                columns=hour_col,
-                values=collision_col,
-                aggfunc="nunique",
-                fill_value=0,
-            )
+        cells = report["heatmap"]
+        if not cells.empty:
+            pivot = cells.pivot(
+                index=weekday_col, columns=hour_col, values="crash_count"
+            ).fillna(0)
             heatmap_fig = px.imshow(
                 pivot.values,
                 x=pivot.columns,
@@ -732,11 +811,9 @@ def update_dashboard(
             px.imshow([[0]], title="Hour / weekday columns not found")
         )
 
-    # 4) Map – crash locations
+    # 3) Map – crash locations
     if lat_col and lon_col:
-        dmap = dff.dropna(subset=[lat_col, lon_col])
-        if len(dmap) > 5000:
-            dmap = dmap.sample(5000, random_state=42)
+        dmap = report["map"]
 
         hover_name = borough_col if borough_col else collision_col
         hover_data = {}
@@ -769,11 +846,12 @@ def update_dashboard(
             px.scatter_mapbox(lat=[], lon=[], title="No location columns found")
         )
 
-    # 5) Pie – injury severity
+    # 4) Pie – injury severity
     if injury_col:
         pie_fig = px.pie(
-            dff,
+            report["injury_counts"],
             names=injury_col,
+            values="count",
             title="Injury Severity Distribution",
             color_discrete_sequence=[
                 PASTEL_PINK,
@@ -793,28 +871,132 @@ def update_dashboard(
         )
 
     # KPI text
-    if collision_col:
-        total_crashes = dff[collision_col].nunique()
-    else:
-        total_crashes = len(dff)
-
-    total_persons = len(dff)
-    if age_col:
-        avg_age = round(dff[age_col].mean(), 1)
-    else:
-        avg_age = "N/A"
+    avg_age = report["avg_age"] if age_col else "N/A"
 
     kpi_text = (
-        f"Report generated from {total_crashes} distinct collisions "
-        f"and {total_persons} person records. "
+        f"Report generated from {report['total_crashes']} distinct collisions "
+        f"and {report['total_persons']} person records. "
         f"Average age of involved persons: {avg_age}."
     )
+    if report.get("search_parsed"):
+        kpi_text += f" Search understood as: {report['search_parsed']}."
+    if cross_sel:
+        picked = "; ".join(
+            f"{d}: {', '.join(str(v) for v in vals)}" for d, vals in cross_sel.items()
+        )
+        kpi_text += f" Chart selection — {picked}."
+
+    return bar_fig, heatmap_fig, map_fig, pie_fig, kpi_text, session_id
+
+
+# ===========================
+# 8) CALLBACKS: CRASHES OVER TIME (DRILL-DOWN)
+# ===========================
+@app.callback(
+    Output("time-level", "value"),
+    Output("time-window", "data"),
+    Input("line-year", "clickData"),
+    Input("line-year", "relayoutData"),
+    Input("btn-reset-time", "n_clicks"),
+    Input("time-level", "value"),
+    State("time-window", "data"),
+)
+def update_time_view(click, relayout, reset_clicks, level, window):
+    from time_rollups import FINER, drill_window
+
+    trigger = ctx.triggered_id
+    level = level or "year"
+
+    if trigger == "btn-reset-time":
+        return "year", None
+    if trigger == "time-level":
+        # a level picked by hand shows the whole range again (a drilled
+        # window is narrower than one bucket of a coarser level)
+        return level, None
+    if trigger == "line-year" and get_data().meta["has_rollups"] and level in FINER:
+        # clicked point -> that period at the next level down
+        if "line-year.clickData" in ctx.triggered_prop_ids and click:
+            start = click["points"][0]["x"]
+            return FINER[level], drill_window(level, start)
+        # selected x range -> the next level down inside that range
+        if relayout and "xaxis.range[0]" in relayout:
+            start = str(relayout["xaxis.range[0]"])[:10]
+            end = str(relayout["xaxis.range[1]"])[:10]
+            return FINER[level], [start, end]
+    return level, window
+
+
+@app.callback(
+    Output("line-year", "figure"),
+    Input("btn-generate", "n_clicks"),
+    Input("cross-filter", "data"),
+    Input("time-level", "value"),
+    Input("time-window", "data"),
+    State("filter-borough", "value"),
+    State("filter-year", "value"),
+    State("filter-vehicle", "value"),
+    State("filter-factor", "value"),
+    State("filter-age-group", "value"),
+    State("search-box", "value"),
+    State("session-id", "data"),
+)
+def update_time_chart(
+    n_clicks,
+    cross_sel,
+    level,
+    window,
+    borough_sel,
+    year_sel,
+    vehicle_sel,
+    factor_sel,
+    age_group_sel,
+    search_text,
+    session_id,
+):
+    import plotly.express as px
+
+    level = level or "year"
+    cross_sel = cross_sel or {}
+    search_text = (search_text or "").strip()
+    data = get_data()
+    dropdown_sel = {
+        "borough": borough_sel or [],
+        "year": year_sel or [],
+        "vehicle": vehicle_sel or [],
+        "factor": factor_sel or [],
+        "age_group": age_group_sel or [],
+    }
+
+    if not data.meta["has_rollups"]:
+        return style_fig(px.line(title="Crash date column not found"))
+
+    counts, _ = data.time_series(
+        level, session_id, dropdown_sel, search_text, cross_sel, window
+    )
 
-    return bar_fig, line_fig, heatmap_fig, map_fig, pie_fig, kpi_text
+    title = f"Crashes Over Time — by {level}"
+    if window:
+        title += f" ({window[0]} → {window[1]})"
+    if counts.empty:
+        return style_fig(px.line(title=title + " — no data"))
+
+    line_fig = px.line(
+        counts,
+        x="period",
+        y="crash_count",
+        markers=len(counts) <= 120,
+        title=title,
+    )
+    line_fig.update_traces(
+        line=dict(color=PASTEL_BLUE, width=3),
+        marker=dict(color=PASTEL_BLUE, size=6),
+    )
+    return style_fig(line_fig)
 
 
 # ===========================
-# 6) RUN APP LOCALLY
+# 9) RUN APP LOCALLY
 # ===========================
 if __name__ == "__main__":
+    start_warmup()
     app.run_server(host="0.0.0.0", port=8050, debug=False)
\ No newline at end of file
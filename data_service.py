@@ -0,0 +1,299 @@
+"""Optional local data service: one process holds the data, Dash workers ask it.
+
+Without it every app.py worker loads merged_final.parquet and builds its
+own indexes. With it, one process owns the prepared Dataset and answers
+over Arrow Flight, and the workers are thin stateless clients:
+
+    python data_service.py --location grpc+unix:///tmp/nyc-data.sock
+    DATA_SERVICE=grpc+unix:///tmp/nyc-data.sock gunicorn app:server -w 4
+
+(use grpc://0.0.0.0:8815 / grpc://host:8815 to serve workers on other hosts).
+
+Small requests (meta, chart aggregates, facet counts, time series) are
+Flight actions: the JSON request goes in the action body and the answer
+comes back as one JSON result followed by one Arrow IPC stream per
+table. Row exports are Flight streams (do_get), so batches flow through
+without the worker holding the whole result.
+"""
+
+import argparse
+import json
+import queue
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.flight as flight
+
+from dataset import Dataset, load_data
+
+DEFAULT_LOCATION = "grpc://127.0.0.1:8815"
+
+
+# ===========================
+# 1) WIRE FORMAT
+# ===========================
+def encode(result):
+    # {key: DataFrame | JSON value} -> [json header, table, table, ...]
+    header, tables = {}, []
+    for key, value in result.items():
+        if isinstance(value, pd.DataFrame):
+            header[key] = {"__table__": len(tables)}
+            tables.append(pa.Table.from_pandas(value, preserve_index=False))
+        else:
+            header[key] = value
+    bodies = [json.dumps(header).encode("utf-8")]
+    for table in tables:
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        bodies.append(sink.getvalue())
+    return bodies
+
+
+def decode(bodies):
+    header = json.loads(bytes(bodies[0]))
+    tables = [pa.ipc.open_stream(b).read_all().to_pandas() for b in bodies[1:]]
+    for key, value in header.items():
+        if isinstance(value, dict) and "__table__" in value:
+            header[key] = tables[value["__table__"]]
+    return header
+
+
+# ===========================
+# 2) SERVER
+# ===========================
+class DataService(flight.FlightServerBase):
+    def __init__(self, dataset, location=DEFAULT_LOCATION, **kwargs):
+        super().__init__(location, **kwargs)
+        self.dataset = dataset
+        # action name -> (handler, description)
+        self.actions = {
+            "ping": (self._ping, "liveness check"),
+            "meta": (self._meta, "detected columns and dropdown options"),
+            "chart_data": (self._chart_data, "aggregates for the report charts"),
+            "facet_counts": (self._facet_counts, "per-option counts for the dropdowns"),
+            "time_series": (self._time_series, "crashes over time at one level"),
+        }
+
+    def _ping(self, request):
+        return {"ok": True}
+
+    def _meta(self, request):
+        return {"meta": self.dataset.meta}
+
+    def _chart_data(self, request):
+        return self.dataset.chart_data(**request)
+
+    def _facet_counts(self, request):
+        return {"counts": self.dataset.facet_counts(**request)}
+
+    def _time_series(self, request):
+        series, source = self.dataset.time_series(**request)
+        return {"series": series, "source": source}
+
+    def list_actions(self, context):
+        return [(name, description) for name, (_, description) in self.actions.items()]
+
+    def do_action(self, context, action):
+        if action.type not in self.actions:
+            raise flight.FlightServerError(f"unknown action {action.type!r}")
+        handler, _ = self.actions[action.type]
+        request = json.loads(action.body.to_pybytes() or b"{}")
+        return [flight.Result(pa.py_buffer(body)) for body in encode(handler(request))]
+
+    def do_get(self, context, ticket):
+        # row export: ticket = {"selections", "search", "columns", "batch_size"}
+        request = json.loads(ticket.ticket)
+        schema, batches = self.dataset.export_stream(
+            request.get("selections", {}),
+            request.get("search", ""),
+            request["columns"],
+            request.get("batch_size", 50_000),
+        )
+        return flight.GeneratorStream(schema, batches)
+
+
+# ===========================
+# 3) CLIENT (what app.py uses when DATA_SERVICE is set)
+# ===========================
+class BatchStream:
+    """Record batches of one do_get.
+
+    The pooled connection goes back to the pool when the stream is
+    exhausted or closed - also when it is closed without ever being read
+    (e.g. a download aborted before the first byte).
+    """
+
+    def __init__(self, reader, release):
+        self._reader = reader
+        self._release = release
+
+    def __iter__(self):
+        try:
+            for chunk in self._reader:
+                yield chunk.data
+        finally:
+            self.close()
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is None:
+            return
+        try:
+            self._reader.cancel()  # no-op once the stream is finished
+        finally:
+            release()
+
+
+class DataServiceClient:
+    """Same query methods as Dataset, answered by a DataService."""
+
+    def __init__(self, location=DEFAULT_LOCATION, pool_size=4, timeout=60):
+        self.location = location
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.options = flight.FlightCallOptions(timeout=timeout)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._meta = None
+
+    def _acquire(self):
+        # pooled FlightClient; at most pool_size open at once
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.pool_size
+            if create:
+                self._created += 1
+        if not create:
+            try:
+                return self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(
+                    f"no free data service connection after {self.timeout}s "
+                    f"(pool_size={self.pool_size})"
+                ) from None
+        try:
+            return flight.FlightClient(self.location)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _release(self, client, broken=False):
+        if broken:
+            # drop it, the next call opens a new one
+            client.close()
+            with self._lock:
+                self._created -= 1
+        else:
+            self._idle.put(client)
+
+    @contextmanager
+    def connection(self):
+        client = self._acquire()
+        try:
+            yield client
+        except flight.FlightUnavailableError:
+            self._release(client, broken=True)
+            raise
+        except BaseException:
+            self._release(client)
+            raise
+        else:
+            self._release(client)
+
+    def _call(self, method, **request):
+        body = json.dumps(request).encode("utf-8")
+        with self.connection() as client:
+            results = client.do_action(flight.Action(method, body), self.options)
+            return decode([r.body for r in results])
+
+    def ping(self):
+        return self._call("ping")["ok"]
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            self._meta = self._call("meta")["meta"]
+        return self._meta
+
+    def chart_data(self, session_id, selections, search_text="", cross_sel=None):
+        return self._call(
+            "chart_data",
+            session_id=session_id,
+            selections=selections,
+            search_text=search_text,
+            cross_sel=cross_sel,
+        )
+
+    def facet_counts(self, selections, search_text="", dims=None, cross_sel=None):
+        return self._call(
+            "facet_counts",
+            selections=selections,
+            search_text=search_text,
+            dims=dims,
+            cross_sel=cross_sel,
+        )["counts"]
+
+    def time_series(
+        self, level, session_id, selections, search_text="", cross_sel=None, window=None
+    ):
+        result = self._call(
+            "time_series",
+            level=level,
+            session_id=session_id,
+            selections=selections,
+            search_text=search_text,
+            cross_sel=cross_sel,
+            window=window,
+        )
+        return result["series"], result["source"]
+
+    def export_stream(self, raw_selections, search_text, columns, batch_size):
+        ticket = flight.Ticket(
+            json.dumps(
+                {
+                    "selections": raw_selections,
+                    "search": search_text,
+                    "columns": columns,
+                    "batch_size": batch_size,
+                }
+            ).encode("utf-8")
+        )
+        client = self._acquire()
+        try:
+            reader = client.do_get(ticket, self.options)
+            schema = reader.schema
+        except BaseException as e:
+            self._release(client, broken=isinstance(e, flight.FlightUnavailableError))
+            raise
+
+        return schema, BatchStream(reader, lambda: self._release(client))
+
+
+# ===========================
+# 4) RUN THE SERVICE
+# ===========================
+def main():
+    parser = argparse.ArgumentParser(description="Serve the prepared NYC collisions data over Arrow Flight.")
+    parser.add_argument(
+        "--location",
+        default=DEFAULT_LOCATION,
+        help="grpc://host:port or grpc+unix:///path/to.sock",
+    )
+    args = parser.parse_args()
+
+    dataset = Dataset(load_data())
+    server = DataService(dataset, args.location)
+    print(f"Data service listening on {args.location}")
+    server.serve()
+
+
+if __name__ == "__main__":
+    main()
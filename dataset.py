@@ -0,0 +1,482 @@
+"""The prepared dataset behind the dashboard.
+
+Dataset owns the merged frame, the detected columns, the engineered
+features, the FilterEngine and the TimeRollups, and answers every data
+question the dashboard asks with small tables (chart aggregates, facet
+counts, time series) or batches of rows (export). app.py only renders.
+
+The same methods are served over Arrow Flight by data_service.py, so a
+Dash worker can use either a local Dataset or a DataServiceClient.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from filter_engine import FilterEngine
+from query_parser import QueryParser
+from time_rollups import TimeRollups
+
+# ===========================
+# 1) LOAD FULL MERGED DATA FROM GITHUB PARQUET
+# ===========================
+
+LOCAL_PARQUET = "merged_final.parquet"
+
+def load_data():
+    # guaranteed local file load
+    if os.path.exists(LOCAL_PARQUET):
+        print("Loading full dataset from local merged_final.parquet ...")
+        df = pd.read_parquet(LOCAL_PARQUET)
+        print("Loaded parquet:", df.shape)
+        return df
+    else:
+        raise FileNotFoundError(
+            "merged_final.parquet not found! Make sure it is included in your Space."
+        )
+
+# PARQUET_URL = "https://raw.githubusercontent.com/Salmakhaled204/nyc-collisions-w25/salma-parquet/merged_final.parquet"
+# LOCAL_PARQUET = "merged_final.parquet"
+# LOCAL_CSV = "sample_final.csv"  # this file is already in your Space repo
+
+# def load_data():
+#     # 1) try to read an existing local parquet file
+#     if os.path.exists(LOCAL_PARQUET):
+#         try:
+#             print("Trying local parquet...")
+#             df = pd.read_parquet(LOCAL_PARQUET)
+#             print("Loaded local parquet:", df.shape)
+#             return df
+#         except Exception as e:
+#             print("Failed to read local parquet, will try download:", e)
+
+#     # 2) try to download parquet from GitHub and read it
+#     try:
+#         print("Downloading merged_final.parquet from GitHub...")
+#         resp = requests.get(PARQUET_URL, timeout=60)
+#         resp.raise_for_status()
+#         with open(LOCAL_PARQUET, "wb") as f:
+#             f.write(resp.content)
+#         print("Download finished. Reading parquet...")
+#         df = pd.read_parquet(LOCAL_PARQUET)
+#         print("Loaded downloaded parquet:", df.shape)
+#         return df
+#     except Exception as e:
+#         print("Failed to download/read parquet, FALLING BACK to CSV:", e)
+
+#     # 3) fallback: use the CSV shipped with the Space
+#     print("Loading fallback CSV:", LOCAL_CSV)
+#     df = pd.read_csv(LOCAL_CSV)
+#     print("Loaded CSV:", df.shape)
+#     return df
+
+# ===========================
+# 2) HELPER: GUESS COLUMN NAMES
+# ===========================
+def guess_col(df, candidates):
+    # exact match
+    for c in candidates:
+        if c in df.columns:
+            return c
+    # substring match (case-insensitive)
+    for col in df.columns:
+        for c in candidates:
+            if c.lower() in col.lower():
+                return col
+    return None
+
+
+def arrow_schema(frame):
+    # columns that are entirely null in the sample are exported as strings
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, pa.field(field.name, pa.string()))
+    return schema
+
+
+def plain(values):
+    # numpy scalars -> python values (JSON / Flight friendly)
+    return [v.item() if isinstance(v, np.generic) else v for v in values]
+
+
+# which cross-filter dims each chart sets itself (a chart is never
+# filtered by its own selection)
+CROSS_OWNERS = {
+    "bar": {"borough"},
+    "heatmap": {"weekday", "hour"},
+    "pie": {"injury"},
+}
+
+MAP_SAMPLE = 5000
+
+# the dropdowns whose option counts the page asks for on load
+FACET_DIMS = ["borough", "year", "vehicle", "factor", "age_group"]
+
+
+def merged_selections(dropdown_sel, cross_sel):
+    # chart selections narrow the dropdown ones on the same dimension
+    merged = {d: list(v) for d, v in dropdown_sel.items() if v}
+    for dim, values in (cross_sel or {}).items():
+        if dim in merged:
+            merged[dim] = [v for v in merged[dim] if v in values] or [None]
+        else:
+            merged[dim] = list(values)
+    return merged
+
+
+class Dataset:
+    def __init__(self, df):
+        self.df = df
+
+        self.collision_col = guess_col(df, ["collision_id"])
+        self.borough_col = guess_col(df, ["borough"])
+        self.year_col = guess_col(df, ["crash_year", "year"])
+        self.date_crash_col = guess_col(df, ["crash_date_crash", "crash_date"])
+        self.factor_col = guess_col(df, ["contributing_factor_vehicle_1", "contributing_factor"])
+        self.vehicle_col = guess_col(df, ["vehicle_type_code_1", "vehicle_type"])
+        self.age_col = guess_col(df, ["person_age_imputed", "person_age"])
+        self.injury_col = guess_col(df, ["person_injury_clean", "person_injury"])
+        self.lat_col = guess_col(df, ["latitude", "lat"])
+        self.lon_col = guess_col(df, ["longitude", "lon", "long"])
+        self.hour_col = guess_col(df, ["crash_hour", "hour"])
+        self.weekday_col = guess_col(df, ["crash_weekday"])
+
+        print("Detected columns:")
+        for name in [
+            "collision_col",
+            "borough_col",
+            "year_col",
+            "date_crash_col",
+            "factor_col",
+            "vehicle_col",
+            "age_col",
+            "injury_col",
+            "lat_col",
+            "lon_col",
+            "hour_col",
+            "weekday_col",
+        ]:
+            print(f" {name}: {getattr(self, name)}")
+
+        self._engineer_features()
+
+        # filter engine (dropdown dims + chart cross-filter dims)
+        self.filter_dims = {
+            name: col
+            for name, col in [
+                ("borough", self.borough_col),
+                ("year", self.year_col),
+                ("vehicle", self.vehicle_col),
+                ("factor", self.factor_col),
+                ("age_group", "age_group"),
+                ("hour", self.hour_col),
+                ("weekday", self.weekday_col),
+                ("injury", self.injury_col),
+            ]
+            if col is not None
+        }
+        self.engine = FilterEngine(
+            df, self.filter_dims, self.search_cols, count_col=self.collision_col
+        )
+
+        # free-text search -> per-dimension filters (see query_parser.py)
+        self.parser = QueryParser(
+            {
+                dim: self.engine.index[dim].uniques
+                for dim in ["borough", "year", "vehicle", "factor", "injury", "age_group"]
+                if dim in self.engine.index
+            }
+        )
+
+        # year / month / week / day rollups for the crashes-over-time chart
+        self.rollups = (
+            TimeRollups(df[self.date_crash_col], self.engine)
+            if self.date_crash_col
+            else None
+        )
+
+        self.warm_caches()
+
+    def warm_caches(self):
+        # what the first page load asks for, computed while loading (in the
+        # app's background warm-up) instead of on the first request
+        self.engine.facet_counts({}, "", [d for d in FACET_DIMS if d in self.engine.index])
+        if self.rollups is not None:
+            self.rollups.warm()
+
+    # ===========================
+    # 3) FEATURE ENGINEERING
+    # ===========================
+    def _engineer_features(self):
+        df = self.df
+
+        # date → year + weekday
+        if self.date_crash_col is not None:
+            df[self.date_crash_col] = pd.to_datetime(df[self.date_crash_col], errors="coerce")
+
+            if self.year_col is None:
+                df["crash_year_tmp"] = df[self.date_crash_col].dt.year
+                self.year_col = "crash_year_tmp"
+
+            if self.weekday_col is None:
+                df["crash_weekday_tmp"] = df[self.date_crash_col].dt.day_name()
+                self.weekday_col = "crash_weekday_tmp"
+
+        # age groups
+        if self.age_col is not None:
+            df["age_group"] = pd.cut(
+                df[self.age_col],
+                bins=[0, 17, 30, 45, 60, 120],
+                labels=["<18", "18–30", "31–45", "46–60", "60+"],
+            )
+        else:
+            df["age_group"] = "Unknown"
+
+        # injury column clean
+        if self.injury_col is not None:
+            df[self.injury_col] = df[self.injury_col].fillna("UNKNOWN")
+
+        # columns used for search
+        self.search_cols = [
+            c
+            for c in [
+                self.borough_col,
+                self.factor_col,
+                self.vehicle_col,
+                self.injury_col,
+                "age_group",
+                self.year_col,
+            ]
+            if c is not None
+        ]
+
+        self.borough_options = self.unique_sorted(self.borough_col)
+        self.year_options = self.unique_sorted(self.year_col)
+        self.vehicle_options = self.unique_sorted(self.vehicle_col)
+        self.factor_options = self.unique_sorted(self.factor_col)
+        self.age_group_options = [str(a) for a in self.unique_sorted("age_group")]
+
+        print(
+            "Unique counts:",
+            "borough",
+            len(self.borough_options),
+            "year",
+            len(self.year_options),
+            "vehicle",
+            len(self.vehicle_options),
+            "factor",
+            len(self.factor_options),
+            "age_group",
+            len(self.age_group_options),
+        )
+
+    def unique_sorted(self, col):
+        if col is None:
+            return []
+        return plain(sorted(self.df[col].dropna().unique()))
+
+    @property
+    def meta(self):
+        # everything the layout needs, as plain JSON values
+        names = [
+            "collision_col",
+            "borough_col",
+            "year_col",
+            "date_crash_col",
+            "factor_col",
+            "vehicle_col",
+            "age_col",
+            "injury_col",
+            "lat_col",
+            "lon_col",
+            "hour_col",
+            "weekday_col",
+            "borough_options",
+            "year_options",
+            "vehicle_options",
+            "factor_options",
+            "age_group_options",
+        ]
+        meta = {name: getattr(self, name) for name in names}
+        meta["columns"] = [str(c) for c in self.df.columns]
+        meta["filter_dims"] = list(self.filter_dims)
+        meta["has_rollups"] = self.rollups is not None
+        return meta
+
+    # ===========================
+    # 4) QUERIES
+    # ===========================
+    def resolve_search(self, selections, search_text):
+        # search tokens that name a borough / year / ... become filters on
+        # that dimension (narrowing the dropdown choice); the rest stays text
+        parsed = self.parser.parse(search_text)
+        return merged_selections(selections, parsed.selections), parsed.text, parsed
+
+    def rows(self, session_id, selections, search_text="", cross_sel=None, chart=None):
+        # positions for one chart: the session's (incremental) filter result
+        # narrowed by every chart selection except the ones made on that chart
+        pos, _ = self.engine.query(session_id, selections, search_text)
+        own = CROSS_OWNERS.get(chart, set())
+        extra = {d: v for d, v in (cross_sel or {}).items() if d not in own}
+        if extra:
+            pos = self.engine.refine(pos, extra)
+        return pos
+
+    def chart_data(self, session_id, selections, search_text="", cross_sel=None):
+        """Small aggregate tables for the bar, heatmap, map, pie and KPI card."""
+        df = self.df
+        collision_col = self.collision_col
+        cross_sel = cross_sel or {}
+        selections, search_text, parsed = self.resolve_search(selections, search_text)
+
+        base, mode = self.engine.query(session_id, selections, search_text)
+        out = {"mode": mode, "search_parsed": parsed.describe()}
+
+        def take(pos, cols):
+            # only the columns an aggregate needs, not a copy of every column
+            cols = list(dict.fromkeys(c for c in cols if c))
+            return df.iloc[pos, [df.columns.get_loc(c) for c in cols]]
+
+        # every chart selection applied: map + KPI (and every chart whose
+        # own selection is not among them)
+        pos = self.engine.refine(base, cross_sel) if cross_sel else base
+        out["n_rows"] = int(len(pos))
+        if len(pos) == 0:
+            return out
+        dff = take(
+            pos,
+            [
+                collision_col,
+                self.borough_col,
+                self.factor_col,
+                self.age_col,
+                self.injury_col,
+                self.lat_col,
+                self.lon_col,
+                self.hour_col,
+                self.weekday_col,
+            ],
+        )
+
+        def rows(chart, cols):
+            # a chart is not narrowed by its own selection
+            own = CROSS_OWNERS[chart]
+            extra = {d: v for d, v in cross_sel.items() if d not in own}
+            if len(extra) == len(cross_sel):
+                return dff
+            return take(self.engine.refine(base, extra) if extra else base, cols)
+
+        # 1) Bar – crashes per borough
+        if self.borough_col:
+            out["borough_counts"] = (
+                rows("bar", [self.borough_col, collision_col]).groupby(self.borough_col)[collision_col]
+                .nunique()
+                .reset_index(name="crash_count")
+                .sort_values("crash_count", ascending=False)
+            )
+
+        # 2) Heatmap – hour vs weekday (long form)
+        if self.hour_col and self.weekday_col:
+            tmp = rows("heatmap", [self.weekday_col, self.hour_col, collision_col]).dropna(subset=[self.hour_col, self.weekday_col])
+            out["heatmap"] = (
+                tmp.groupby([self.weekday_col, self.hour_col])[collision_col]
+                .nunique()
+                .reset_index(name="crash_count")
+            )
+
+        # 3) Map – crash locations (sample)
+        if self.lat_col and self.lon_col:
+            dmap = dff.dropna(subset=[self.lat_col, self.lon_col])
+            if len(dmap) > MAP_SAMPLE:
+                dmap = dmap.sample(MAP_SAMPLE, random_state=42)
+            cols = [self.lat_col, self.lon_col] + [
+                c for c in [self.borough_col, collision_col, self.factor_col] if c
+            ]
+            out["map"] = dmap[list(dict.fromkeys(cols))].reset_index(drop=True)
+
+        # 4) Pie – injury severity
+        if self.injury_col:
+            out["injury_counts"] = (
+                rows("pie", [self.injury_col])[self.injury_col]
+                .value_counts()
+                .rename_axis(self.injury_col)
+                .reset_index(name="count")
+            )
+
+        # 5) KPI numbers
+        out["total_crashes"] = int(dff[collision_col].nunique()) if collision_col else int(len(dff))
+        out["total_persons"] = int(len(dff))
+        out["avg_age"] = (
+            round(float(dff[self.age_col].mean()), 1) if self.age_col else None
+        )
+        return out
+
+    def facet_counts(self, selections, search_text="", dims=None, cross_sel=None):
+        # filters parsed from the search box and chart selections hold for
+        # every dropdown (picking QUEENS under "brooklyn" returns nothing, so
+        # it must count 0); only a dropdown's own selection is left out
+        parsed = self.parser.parse(search_text)
+        counts = self.engine.facet_counts(
+            selections,
+            parsed.text,
+            dims,
+            fixed=merged_selections(parsed.selections, cross_sel),
+        )
+        return {d: {"values": plain(c.keys()), "counts": list(c.values())} for d, c in counts.items()}
+
+    def time_series(
+        self, level, session_id, selections, search_text="", cross_sel=None, window=None
+    ):
+        """DataFrame(period, crash_count) + where it came from ("rollup"/"rows")."""
+        if self.rollups is None:
+            return pd.DataFrame({"period": [], "crash_count": []}), None
+
+        # served from a rollup when possible; the row path reuses the
+        # session's cached filter result
+        selections, search_text, _ = self.resolve_search(selections, search_text)
+        merged = merged_selections(selections, cross_sel)
+        state = self.engine.normalize(merged)
+        pos = None
+        if search_text or len(state) > 1 or any(len(c) != 1 for c in state.values()):
+            pos = self.rows(session_id, selections, search_text, cross_sel)
+        return self.rollups.series(level, merged, search_text, window, pos)
+
+    def export_stream(self, raw_selections, search_text, columns, batch_size):
+        """(arrow schema, iterator of record batches) of the matching rows.
+
+        `raw_selections` are query-string values ({dim: [str]}); batches
+        have at most `batch_size` rows and are built one at a time.
+        """
+        selections = {
+            dim: self.engine.index[dim].parse(values)
+            for dim, values in raw_selections.items()
+            if dim in self.engine.index and values
+        }
+        selections, search_text, _ = self.resolve_search(selections, search_text)
+        pos, _ = self.engine.query(None, selections, search_text)
+        print(f"[EXPORT] rows={len(pos)}, columns={len(columns)}")
+
+        df = self.df
+        col_idx = [df.columns.get_loc(c) for c in columns]
+        # categoricals (age_group) go out as plain values so that every
+        # batch has the same schema, without per-batch dictionaries
+        categorical = [
+            c for c in columns if isinstance(df[c].dtype, pd.CategoricalDtype)
+        ]
+
+        def plain_chunk(chunk):
+            if categorical:
+                chunk = chunk.astype({c: object for c in categorical})
+            return chunk
+
+        schema = arrow_schema(plain_chunk(df.iloc[: min(len(df), batch_size), col_idx]))
+
+        def batches():
+            for start in range(0, len(pos), batch_size):
+                chunk = plain_chunk(df.iloc[pos[start:start + batch_size], col_idx])
+                yield pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+
+        return schema, batches()
@@ -0,0 +1,135 @@
+"""Streaming export of the filtered rows behind a report.
+
+GET /export?borough=BROOKLYN&year=2022&search=pedestrian&columns=collision_id,borough&format=parquet
+
+Any FilterEngine dimension can be passed (repeat the parameter for several
+values), plus `search`, `columns` (comma separated, default: all) and
+`format` (`parquet` or `csv`); any other parameter is a 400. Rows are
+written in record batches of `BATCH_SIZE` rows, so the response never
+holds more than one batch in memory however many rows match. The batches come from the Dataset (or
+from the data service, see data_service.py).
+"""
+
+import io
+
+from flask import Response, abort, request, stream_with_context
+
+BATCH_SIZE = 50_000
+
+
+class _ChunkSink(io.RawIOBase):
+    # write-only file object that hands out whatever has been written
+    def __init__(self):
+        self._parts = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        self._size += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._size
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def stream_parquet(schema, batches):
+    import pyarrow.parquet as pq  # not needed until someone exports
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in batches:
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_csv(schema, batches):
+    header = True
+    for batch in batches:
+        yield batch.to_pandas().to_csv(index=False, header=header).encode("utf-8")
+        header = False
+    if header:
+        # no matching rows: still send the header line
+        yield (",".join(schema.names) + "\n").encode("utf-8")
+
+
+def register_export(server, get_data, route="/export"):
+    # get_data() returns the Dataset / DataServiceClient, waiting for it if
+    # the app is still loading
+    @server.route(route)
+    def export_rows():
+        fmt = request.args.get("format", "parquet").lower()
+        if fmt not in ("parquet", "csv"):
+            abort(400, "format must be 'parquet' or 'csv'")
+
+        data = get_data()
+
+        meta = data.meta
+        all_columns = meta["columns"]
+        # asked-for order, each column once
+        columns = list(dict.fromkeys(
+            c.strip()
+            for arg in request.args.getlist("columns")
+            for c in arg.split(",")
+            if c.strip()
+        )) or list(all_columns)
+        unknown = [c for c in columns if c not in all_columns]
+        if unknown:
+            abort(400, f"unknown columns: {', '.join(unknown)}")
+
+        # a misspelled filter must not silently export everything
+        unknown = [
+            key
+            for key in request.args
+            if key not in ("format", "columns", "search") and key not in meta["filter_dims"]
+        ]
+        if unknown:
+            abort(
+                400,
+                f"unknown parameters: {', '.join(unknown)} (filters: "
+                f"{', '.join(meta['filter_dims'])})",
+            )
+
+        raw_selections = {
+            key: request.args.getlist(key)
+            for key in request.args
+            if key not in ("format", "columns", "search")
+        }
+        schema, batches = data.export_stream(
+            raw_selections, request.args.get("search", ""), columns, BATCH_SIZE
+        )
+
+        if fmt == "parquet":
+            body = stream_parquet(schema, batches)
+            mimetype = "application/vnd.apache.parquet"
+        else:
+            body = stream_csv(schema, batches)
+            mimetype = "text/csv"
+
+        response = Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=nyc_collisions_export.{fmt}"
+            },
+        )
+        # the batches may hold a data service connection: give it back even
+        # if the download is aborted before the body is ever iterated
+        if hasattr(batches, "close"):
+            response.call_on_close(batches.close)
+        return response
+
+    return export_rows
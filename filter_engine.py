@@ -0,0 +1,427 @@
+"""Incremental filter engine for the dashboard.
+
+Every filterable column is factorized once into integer codes plus posting
+lists (row positions per value). A report is a sorted array of row
+positions instead of a boolean mask over the whole frame, and the last
+result of every session is kept so that the next request can be answered
+from it:
+
+* narrowing (e.g. removing a borough, adding a factor) only re-checks the
+  rows of the previous result;
+* widening (e.g. adding a year) only looks up the delta rows from the
+  posting lists and merges them into the previous result;
+* anything else is rebuilt from the smallest posting list.
+
+The same codes give facet counts (how many crashes each dropdown option
+would return under the other active filters) with one bincount per
+dimension instead of one re-filter per option.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# row positions are stored as int32: half the memory of int64 for the
+# session cache, and far more rows than one container can hold
+POS_DTYPE = np.int32
+
+
+def distinct(values):
+    # sorted unique values; sort + neighbour compare is far faster than
+    # np.unique on large integer arrays with recent numpy
+    values = np.sort(values)
+    if len(values) > 1:
+        values = values[np.concatenate(([True], values[1:] != values[:-1]))]
+    return values
+
+
+def distinct_counts(values):
+    # (sorted unique values, how often each occurs), sort-based as above
+    values = np.sort(values)
+    if not len(values):
+        return values, np.zeros(0, dtype=np.int64)
+    first = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    return values[first], np.diff(np.append(first, len(values)))
+
+
+# ===========================
+# 1) PER-COLUMN INDEX
+# ===========================
+class ColumnIndex:
+    def __init__(self, series):
+        # NaN / None -> code -1
+        codes, uniques = pd.factorize(series, sort=True)
+        self.codes = codes.astype(np.int32, copy=False)
+        self.uniques = list(uniques)
+        self.lookup = {v: i for i, v in enumerate(self.uniques)}
+
+        # posting lists: rows of code c are order[starts[c + 1]:starts[c + 2]]
+        self.order = np.argsort(self.codes, kind="stable").astype(POS_DTYPE)
+        self.starts = np.searchsorted(
+            self.codes[self.order], np.arange(-1, len(self.uniques) + 1)
+        )
+
+    def codes_for(self, values):
+        # unknown values simply match nothing (same as Series.isin)
+        return frozenset(self.lookup[v] for v in values if v in self.lookup)
+
+    def parse(self, raw_values):
+        # query-string values -> column values ("2022" matches 2022.0);
+        # anything unknown is kept as-is and simply matches no row
+        by_text = {}
+        for v in self.uniques:
+            by_text[str(v)] = v
+            if isinstance(v, (float, np.floating)) and float(v).is_integer():
+                by_text[str(int(v))] = v
+        return [by_text.get(r, r) for r in raw_values]
+
+    def count(self, code):
+        return int(self.starts[code + 2] - self.starts[code + 1])
+
+    def positions(self, codes):
+        parts = [self.order[self.starts[c + 1]:self.starts[c + 2]] for c in codes]
+        if not parts:
+            return np.empty(0, dtype=POS_DTYPE)
+        return np.sort(np.concatenate(parts), kind="stable")
+
+    def member(self, codes):
+        # lookup table: member(codes)[code + 1] is True for the given codes
+        table = np.zeros(len(self.uniques) + 1, dtype=bool)
+        table[np.fromiter(codes, dtype=np.int64, count=len(codes)) + 1] = True
+        return table
+
+    def keep(self, pos, codes):
+        # subset of `pos` whose value is one of `codes`
+        return pos[self.member(codes)[self.codes[pos] + 1]]
+
+
+# ===========================
+# 2) ENGINE
+# ===========================
+def _narrower(new, old):
+    # None means "no constraint"
+    return old is None or (new is not None and new <= old)
+
+
+def _wider(new, old):
+    return new is None or (old is not None and old <= new)
+
+
+def _both(state, fixed):
+    # both sets of constraints at once (same dimension: codes intersect)
+    out = dict(state)
+    for name, codes in fixed.items():
+        out[name] = out[name] & codes if name in out else codes
+    return out
+
+
+class SizedLRU:
+    """LRU cache bounded by entry count and by total bytes.
+
+    size(value) gives the bytes an entry holds; a value larger than the
+    whole budget is not stored. Not thread-safe (FilterEngine locks).
+    """
+
+    def __init__(self, max_items, max_bytes, size):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.size = size
+        self.nbytes = 0
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.nbytes -= self.size(old)
+        if self.size(value) > self.max_bytes:
+            return
+        self._items[key] = value
+        self.nbytes += self.size(value)
+        while len(self._items) > self.max_items or self.nbytes > self.max_bytes:
+            _, dropped = self._items.popitem(last=False)
+            self.nbytes -= self.size(dropped)
+
+
+class FilterEngine:
+    def __init__(
+        self,
+        df,
+        dims,
+        search_cols=(),
+        count_col=None,
+        max_sessions=32,
+        max_session_bytes=128 * 2**20,
+        max_searches=32,
+        max_search_bytes=64 * 2**20,
+        max_facets=64,
+    ):
+        # dims: {dimension name: column name}
+        # count_col: facet counts are distinct values of this column
+        # (e.g. collision id) instead of rows
+        # max_session_bytes / max_search_bytes: total size of the cached
+        # session results (4 bytes per row) and search masks (1 byte per
+        # row); on 8M rows one unfiltered session alone is 32 MB
+        self.n_rows = len(df)
+        self.dims = dict(dims)
+        self.index = {}
+        by_col = {}
+        for name, col in self.dims.items():
+            if col not in by_col:
+                by_col[col] = ColumnIndex(df[col])
+            self.index[name] = by_col[col]
+        self.search_index = {}
+        for col in search_cols:
+            if col not in by_col:
+                by_col[col] = ColumnIndex(df[col])
+            self.search_index[col] = by_col[col]
+
+        self.count_index = None
+        if count_col is not None:
+            self.count_index = by_col.get(count_col) or ColumnIndex(df[count_col])
+
+        # dims with one value per count_col value (the crash-level columns
+        # of the crash x person frame): code per collision, so their counts
+        # take each collision once instead of de-duplicating person rows
+        self.per_count = {}
+        if self.count_index is not None:
+            has_id = self.count_index.codes >= 0
+            every = bool(has_id.all())
+            ids = self.count_index.codes if every else self.count_index.codes[has_id]
+            for name, idx in self.index.items():
+                codes = idx.codes if every else idx.codes[has_id]
+                per = np.full(len(self.count_index.uniques), -1, dtype=np.int32)
+                per[ids] = codes
+                if np.array_equal(per[ids], codes):
+                    self.per_count[name] = per
+
+        # session -> (state, search key, positions)
+        self._sessions = SizedLRU(max_sessions, max_session_bytes, lambda e: e[2].nbytes)
+        self._searches = SizedLRU(max_searches, max_search_bytes, lambda m: m.nbytes)
+        self._facets = OrderedDict()
+        self._max_facets = max_facets
+        self._lock = threading.Lock()
+
+    # ---- state helpers ----
+    def normalize(self, selections):
+        # {dim: [values]} -> {dim: frozenset(codes)} (empty selection = no constraint)
+        state = {}
+        for name, values in (selections or {}).items():
+            if name in self.index and values:
+                state[name] = self.index[name].codes_for(values)
+        return state
+
+    def search_mask(self, search_text):
+        # token OR across search columns, substring / case-insensitive.
+        # The match is done on each column's distinct values, then mapped
+        # back to rows through the codes.
+        key = " ".join((search_text or "").lower().split())
+        if not key:
+            return None
+        with self._lock:
+            mask = self._searches.get(key)
+        if mask is not None:
+            return mask
+
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for idx in self.search_index.values():
+            if not idx.uniques:
+                continue
+            labels = pd.Series([str(u) for u in idx.uniques])
+            hit = np.zeros(len(labels), dtype=bool)
+            for token in key.split():
+                hit |= labels.str.contains(token, case=False, regex=False).to_numpy()
+            if hit.any():
+                mask |= idx.member(np.flatnonzero(hit))[idx.codes + 1]
+
+        with self._lock:
+            self._searches.put(key, mask)
+        return mask
+
+    def _apply(self, pos, state, search):
+        for name, codes in state.items():
+            pos = self.index[name].keep(pos, codes)
+        if search is not None:
+            pos = pos[search[pos]]
+        return pos
+
+    def _full_cost(self, state):
+        # rows _full starts from: the smallest posting list (or every row)
+        if not state:
+            return self.n_rows
+        return min(
+            sum(self.index[d].count(c) for c in codes) for d, codes in state.items()
+        )
+
+    def _full(self, state, search):
+        if not state:
+            pos = np.arange(self.n_rows, dtype=POS_DTYPE)
+            rest = {}
+        else:
+            # start from the dimension with the fewest matching rows
+            first = min(
+                state,
+                key=lambda d: sum(self.index[d].count(c) for c in state[d]),
+            )
+            pos = self.index[first].positions(state[first])
+            rest = {d: c for d, c in state.items() if d != first}
+        return self._apply(pos, rest, search)
+
+    # ---- public API ----
+    def query(self, session_id, selections, search_text=""):
+        """(row positions (sorted), mode) for the dropdown selections + search.
+
+        mode says how the result was reached: "full", "cached", "narrow"
+        or "widen".
+        """
+        state = self.normalize(selections)
+        key = " ".join((search_text or "").lower().split())
+        search = self.search_mask(key)
+
+        prev = None
+        if session_id is not None:
+            with self._lock:
+                prev = self._sessions.get(session_id)
+
+        names = set(state)
+        if prev is not None:
+            names |= set(prev[0])
+
+        if prev is None or prev[1] != key:
+            mode = "full"
+            pos = self._full(state, search)
+        else:
+            old_state, _, old_pos = prev
+            pairs = {d: (state.get(d), old_state.get(d)) for d in names}
+            changed = {d: p for d, p in pairs.items() if p[0] != p[1]}
+
+            # the previous result is only worth reusing when it is smaller
+            # than what a rebuild would start from
+            full_cost = self._full_cost(state)
+            if not changed:
+                mode = "cached"
+                pos = old_pos
+            elif (
+                all(_narrower(new, old) for new, old in changed.values())
+                and len(old_pos) < full_cost
+            ):
+                mode = "narrow"
+                pos = self._apply(old_pos, {d: p[0] for d, p in changed.items()}, None)
+            elif all(_wider(new, old) for new, old in changed.values()) and (
+                len(old_pos) + self._widen_cost(changed) < full_cost
+            ):
+                mode = "widen"
+                # a new row must pass a widened constraint it failed before,
+                # so the delta is disjoint from the previous result
+                parts = []
+                for d, (new, old) in changed.items():
+                    idx = self.index[d]
+                    if new is None:
+                        parts.append(np.flatnonzero(~idx.member(old)[idx.codes + 1]).astype(POS_DTYPE))
+                    else:
+                        parts.append(idx.positions(new - old))
+                delta = parts[0] if len(parts) == 1 else distinct(np.concatenate(parts))
+                delta = self._apply(delta, state, search)
+                # two sorted runs: the stable sort merges them in linear time
+                pos = np.sort(np.concatenate([old_pos, delta]), kind="stable")
+            else:
+                mode = "full"
+                pos = self._full(state, search)
+
+        if session_id is not None:
+            with self._lock:
+                self._sessions.put(session_id, (state, key, pos))
+
+        return pos, mode
+
+    def _widen_cost(self, changed):
+        # rows looked up for the delta of a widening
+        cost = 0
+        for d, (new, old) in changed.items():
+            idx = self.index[d]
+            if new is None:
+                cost += self.n_rows - sum(idx.count(c) for c in old)
+            else:
+                cost += sum(idx.count(c) for c in new - old)
+        return cost
+
+    def refine(self, pos, selections):
+        """Narrow an existing result by extra selections (cross-filtering)."""
+        return self._apply(pos, self.normalize(selections), None)
+
+    def _counts(self, name, pos):
+        # per-code count of rows (or of distinct count_col values) in `pos`
+        idx = self.index[name]
+        if self.count_index is None:
+            codes = idx.codes[pos]
+        else:
+            ids = self.count_index.codes[pos]
+            if name in self.per_count:
+                # bitmap of the collisions in `pos`, then one code each
+                seen = np.zeros(len(self.count_index.uniques), dtype=bool)
+                seen[ids[ids >= 0]] = True
+                codes = self.per_count[name][seen]
+            else:
+                # distinct (code, collision) pairs
+                codes = idx.codes[pos]
+                keep = (codes >= 0) & (ids >= 0)
+                width = len(self.count_index.uniques)
+                pairs = distinct(codes[keep].astype(np.int64) * width + ids[keep])
+                codes = pairs // width
+        return np.bincount(codes[codes >= 0], minlength=len(idx.uniques))
+
+    def facet_counts(self, selections, search_text="", dims=None, fixed=None):
+        """{dim: {value: count}} for each option of `dims`.
+
+        The count for an option of dimension D is computed under every
+        active filter except D's own selection, so it is what the user
+        would get by adding that option. `fixed` selections (e.g. parsed
+        from the search box) apply to every dimension, D included.
+        """
+        state = self.normalize(selections)
+        fixed = self.normalize(fixed)
+        key = " ".join((search_text or "").lower().split())
+        dims = [d for d in (dims or self.index) if d in self.index]
+
+        cache_key = (
+            tuple(sorted((d, tuple(sorted(c))) for d, c in state.items())),
+            tuple(sorted((d, tuple(sorted(c))) for d, c in fixed.items())),
+            key,
+            tuple(dims),
+        )
+        with self._lock:
+            if cache_key in self._facets:
+                self._facets.move_to_end(cache_key)
+                return self._facets[cache_key]
+
+        search = self.search_mask(key)
+        base = None
+        out = {}
+        for d in dims:
+            if d in state:
+                others = {o: c for o, c in state.items() if o != d}
+                pos = self._full(_both(others, fixed), search)
+            else:
+                # unconstrained dims all share the fully filtered rows
+                if base is None:
+                    base = self._full(_both(state, fixed), search)
+                pos = base
+            idx = self.index[d]
+            counts = self._counts(d, pos)
+            out[d] = {v: int(counts[i]) for i, v in enumerate(idx.uniques)}
+
+        with self._lock:
+            self._facets[cache_key] = out
+            while len(self._facets) > self._max_facets:
+                self._facets.popitem(last=False)
+        return out
@@ -0,0 +1,27 @@
+"""gunicorn settings for the serving image (see Dockerfile).
+
+    gunicorn app:server -c gunicorn.conf.py
+
+The app module is imported once in the master (preload_app) - cheap, since
+app.py defers pandas / pyarrow / plotly - and every worker starts loading
+the data right after the fork. /healthz answers at once, /readyz turns 200
+when the worker's data is loaded.
+"""
+
+import os
+
+bind = "0.0.0.0:" + os.environ.get("PORT", "7860")
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+# a few threads per worker so /healthz and /readyz are answered while
+# callbacks are waiting for the data
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+preload_app = True
+# the first callbacks wait for the warm-up
+timeout = 120
+
+
+def post_fork(server, worker):
+    # threads do not survive fork(), so the warm-up starts in each worker
+    import app
+
+    app.start_warmup()
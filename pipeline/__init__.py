@@ -0,0 +1,22 @@
+"""Cleaning pipeline for the raw NYC crashes / persons downloads.
+
+    from pipeline import clean_csv
+    report = clean_csv("persons", "persons_raw.csv", "df_persons_cleaned.csv", workers=8)
+    print(report)
+
+or from the command line:
+
+    python -m pipeline persons persons_raw.csv df_persons_cleaned.csv --workers 8
+"""
+
+from .cleaning import STEPS, crash_steps, person_steps
+from .runner import StepReport, clean_csv, scan_age_medians
+
+__all__ = [
+    "STEPS",
+    "StepReport",
+    "clean_csv",
+    "crash_steps",
+    "person_steps",
+    "scan_age_medians",
+]
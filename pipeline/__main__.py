@@ -0,0 +1,32 @@
+import argparse
+
+from .runner import CHUNKSIZE, clean_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m pipeline",
+        description="Clean a raw NYC crashes or persons CSV in parallel chunks.",
+    )
+    parser.add_argument("kind", choices=["crashes", "persons"])
+    parser.add_argument("src", help="raw CSV (as downloaded from NYC Open Data)")
+    parser.add_argument("dst", help="output .csv or .parquet")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--workers", type=int, default=None, help="default: all cores")
+    parser.add_argument("--keep-duplicates", action="store_true")
+    args = parser.parse_args()
+
+    print(f"Cleaning {args.kind}: {args.src} -> {args.dst}")
+    report = clean_csv(
+        args.kind,
+        args.src,
+        args.dst,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        dedup=not args.keep_duplicates,
+    )
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
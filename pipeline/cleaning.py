@@ -0,0 +1,174 @@
+"""Vectorized cleaning steps for the raw crashes and persons CSVs.
+
+These are the Member 3 notebook steps (Step 1 - Step 3) rewritten as
+column-wise transforms that work on any chunk of rows. Every step takes
+and returns a DataFrame; anything that needs the whole file (the age
+medians) is passed in as a parameter computed by a first pass.
+
+Raw chunks are read with every column as text so that each chunk gets
+the same dtypes no matter which rows it contains.
+"""
+
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+# column -> dtype for the numeric columns that are not derived
+CRASH_NUMERIC = {"collision_id": "Int64", "latitude": "float64", "longitude": "float64"}
+PERSON_NUMERIC = {"unique_id": "Int64", "collision_id": "Int64", "vehicle_id": "float64"}
+
+AGE_MIN, AGE_MAX = 0, 110
+
+
+# ===========================
+# 1) SHARED STEPS
+# ===========================
+def normalize_cols(df):
+    df = df.copy()
+    df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+    return df
+
+
+def to_numeric(df, columns):
+    for col, dtype in columns.items():
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors="coerce")
+            if dtype == "Int64":
+                # ids never have decimals; anything else is treated as missing
+                values = values.where(values == values.round())
+            df[col] = values.astype(dtype)
+    return df
+
+
+def parse_dates(values, fmt):
+    # raw exports use one format; anything else goes through pandas' parser
+    parsed = pd.to_datetime(values, format=fmt, errors="coerce")
+    rest = parsed.isna() & values.notna()
+    if rest.any():
+        parsed[rest] = pd.to_datetime(values[rest], format="mixed", errors="coerce")
+    return parsed
+
+
+# ===========================
+# 2) CRASHES
+# ===========================
+def crash_datetimes(df):
+    df["crash_date"] = parse_dates(df["crash_date"], "%m/%d/%Y")
+    t = pd.to_datetime(df["crash_time"], format="%H:%M", errors="coerce")
+    df["crash_time"] = t.dt.strftime("%H:%M:%S")
+
+    df["crash_hour"] = t.dt.hour.astype("Int64")
+    df["crash_year"] = df["crash_date"].dt.year.astype("Int64")
+    df["crash_month"] = df["crash_date"].dt.to_period("M").astype(str)
+    return df
+
+
+def crash_counts(df):
+    # injury / fatality columns -> int, missing = 0
+    for col in [c for c in df.columns if ("injured" in c or "killed" in c)]:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
+    return df
+
+
+def crash_borough(df):
+    df["borough"] = df["borough"].fillna("Unknown")
+    return df
+
+
+def crash_steps(params=None):
+    return [
+        ("normalize_cols", normalize_cols),
+        ("numeric_columns", partial(to_numeric, columns=CRASH_NUMERIC)),
+        ("datetimes", crash_datetimes),
+        ("injury_counts", crash_counts),
+        ("borough", crash_borough),
+    ]
+
+
+# ===========================
+# 3) PERSONS
+# ===========================
+def person_age(df):
+    age = pd.to_numeric(df["person_age"], errors="coerce")
+    df["person_age"] = age.where((age > AGE_MIN) & (age <= AGE_MAX))
+    return df
+
+
+def age_counts(df):
+    # first pass: per (raw person_type, age) counts, enough for exact medians
+    df = person_age(normalize_cols(df))
+    ages = df[["person_type", "person_age"]].dropna(subset=["person_age"])
+    return ages.groupby(["person_type", "person_age"], dropna=False).size()
+
+
+def medians_from_counts(counts):
+    # exact median of a value -> count table (same as Series.median)
+    def median(c):
+        c = c.sort_index()
+        n = int(c.sum())
+        if n == 0:
+            return np.nan
+        cum = c.cumsum().to_numpy()
+        values = c.index.to_numpy(dtype=float)
+        lo = values[np.searchsorted(cum, (n - 1) // 2, side="right")]
+        hi = values[np.searchsorted(cum, n // 2, side="right")]
+        return (lo + hi) / 2
+
+    by_age = counts.groupby(level="person_age").sum()
+    by_type = {
+        pt: median(c.droplevel("person_type"))
+        for pt, c in counts.groupby(level="person_type", dropna=True)
+    }
+    return {"global": median(by_age), "by_type": by_type}
+
+
+def person_impute_age(df, medians):
+    # missing age -> median of the (raw) person type -> global median
+    by_type = df["person_type"].map(medians["by_type"])
+    df["person_age_imputed"] = (
+        df["person_age"].fillna(by_type).fillna(medians["global"]).astype(float)
+    )
+    return df
+
+
+def person_sex(df):
+    sex = df["person_sex"].astype(str).str.upper().replace({"MALE": "M", "FEMALE": "F"})
+    df["person_sex"] = sex.where(sex.isin(["M", "F"]), np.nan)
+    return df
+
+
+def person_type(df):
+    df["person_type"] = df["person_type"].astype(str).str.upper()
+    return df
+
+
+def person_injury(df):
+    raw = df["person_injury"]
+    s = raw.astype(str).str.upper()
+    df["person_injury_clean"] = np.select(
+        [
+            raw.isna(),
+            s.str.contains("KILLED", regex=False),
+            s.str.contains("INJUR", regex=False),
+            s.str.contains("NONE", regex=False),
+        ],
+        ["UNKNOWN", "KILLED", "INJURED", "NONE"],
+        default="UNKNOWN",
+    )
+    return df
+
+
+def person_steps(params):
+    return [
+        ("normalize_cols", normalize_cols),
+        ("numeric_columns", partial(to_numeric, columns=PERSON_NUMERIC)),
+        ("age", person_age),
+        ("impute_age", partial(person_impute_age, medians=params["age_medians"])),
+        ("sex", person_sex),
+        ("person_type", person_type),
+        ("injury", person_injury),
+    ]
+
+
+STEPS = {"crashes": crash_steps, "persons": person_steps}
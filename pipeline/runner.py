@@ -0,0 +1,191 @@
+"""Chunked, parallel runner for the cleaning steps.
+
+The raw CSV is read in chunks (like convert_to_parquet_chunks.py), each
+chunk is cleaned in a worker process and the results are written back in
+input order, so the output is the same for any number of workers. At
+most `2 * workers` chunks are in flight at a time; memory is bounded by
+the chunk size, plus one 8-byte hash per output row for the global
+duplicate check.
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .cleaning import STEPS, age_counts, medians_from_counts
+
+CHUNKSIZE = 250_000
+
+
+# ===========================
+# 1) ROW / TIME ACCOUNTING
+# ===========================
+class StepReport:
+    def __init__(self):
+        # step -> [rows in, rows out, seconds]
+        self.steps = {}
+        self.wall_seconds = 0.0
+
+    def add(self, step, rows_in, rows_out, seconds):
+        stats = self.steps.setdefault(step, [0, 0, 0.0])
+        stats[0] += rows_in
+        stats[1] += rows_out
+        stats[2] += seconds
+
+    def merge(self, other):
+        for step, (rows_in, rows_out, seconds) in other.steps.items():
+            self.add(step, rows_in, rows_out, seconds)
+
+    def __str__(self):
+        lines = [f"{'step':<18}{'rows in':>12}{'rows out':>12}{'seconds':>10}"]
+        for step, (rows_in, rows_out, seconds) in self.steps.items():
+            lines.append(f"{step:<18}{rows_in:>12,}{rows_out:>12,}{seconds:>10.2f}")
+        lines.append(f"wall time: {self.wall_seconds:.2f}s")
+        return "\n".join(lines)
+
+
+def run_steps(df, steps, report):
+    for name, step in steps:
+        start = time.perf_counter()
+        rows_in = len(df)
+        df = step(df)
+        report.add(name, rows_in, len(df), time.perf_counter() - start)
+    return df
+
+
+# ===========================
+# 2) WORKERS (module level so they can be pickled)
+# ===========================
+def clean_chunk(chunk, kind, params):
+    report = StepReport()
+    df = run_steps(chunk, STEPS[kind](params), report)
+
+    start = time.perf_counter()
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    report.add("hash_rows", len(df), len(df), time.perf_counter() - start)
+    return df, hashes, report
+
+
+def read_chunks(path, chunksize):
+    # everything as text: dtypes are decided by the cleaning steps
+    return pd.read_csv(path, chunksize=chunksize, dtype=str)
+
+
+def ordered_map(fn, items, workers):
+    # like pool.map, but never more than 2 * workers items in flight
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# ===========================
+# 3) OUTPUT
+# ===========================
+class ChunkWriter:
+    # .parquet -> one row group per chunk, anything else -> CSV
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self.writer = None
+        self.schema = None
+        self.header = True
+
+    def write(self, df):
+        if self.parquet:
+            if self.writer is None:
+                schema = pa.Schema.from_pandas(df, preserve_index=False)
+                for i, field in enumerate(schema):
+                    if pa.types.is_null(field.type):
+                        schema = schema.set(i, pa.field(field.name, pa.string()))
+                self.schema = schema
+                self.writer = pq.ParquetWriter(self.path, schema)
+            self.writer.write_table(
+                pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            )
+        else:
+            df.to_csv(self.path, mode="w" if self.header else "a", header=self.header, index=False)
+            self.header = False
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+# ===========================
+# 4) ENTRY POINTS
+# ===========================
+def scan_age_medians(path, chunksize=CHUNKSIZE, workers=None, report=None):
+    """Exact age medians (global + per person type) in one chunked pass."""
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    total = None
+    rows = 0
+    for counts in ordered_map(age_counts, read_chunks(path, chunksize), workers):
+        total = counts if total is None else total.add(counts, fill_value=0)
+        rows += int(counts.sum())
+    if total is None:
+        medians = {"global": np.nan, "by_type": {}}
+    else:
+        medians = medians_from_counts(total)
+    if report is not None:
+        report.add("scan_age_medians", rows, rows, time.perf_counter() - start)
+    return medians
+
+
+def clean_csv(kind, src, dst, chunksize=CHUNKSIZE, workers=None, dedup=True):
+    """Clean a raw `crashes` or `persons` CSV into `dst` (.csv or .parquet).
+
+    Returns a StepReport with rows in / out and time per step.
+    """
+    if kind not in STEPS:
+        raise ValueError(f"kind must be one of {sorted(STEPS)}, got {kind!r}")
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    report = StepReport()
+
+    params = {}
+    if kind == "persons":
+        params["age_medians"] = scan_age_medians(src, chunksize, workers, report)
+
+    seen = np.empty(0, dtype=np.uint64)
+    writer = ChunkWriter(dst)
+    try:
+        worker = partial(clean_chunk, kind=kind, params=params)
+        for df, hashes, chunk_report in ordered_map(worker, read_chunks(src, chunksize), workers):
+            report.merge(chunk_report)
+
+            if dedup:
+                # first occurrence over the whole file, in input order
+                start = time.perf_counter()
+                _, first = np.unique(hashes, return_index=True)
+                keep = np.zeros(len(hashes), dtype=bool)
+                keep[first] = True
+                keep &= ~np.isin(hashes, seen)
+                seen = np.union1d(seen, hashes[keep])
+                report.add("drop_duplicates", len(df), int(keep.sum()), time.perf_counter() - start)
+                df = df[keep]
+
+            start = time.perf_counter()
+            writer.write(df)
+            report.add("write", len(df), len(df), time.perf_counter() - start)
+    finally:
+        writer.close()
+
+    report.wall_seconds = time.perf_counter() - started
+    return report
@@ -0,0 +1,81 @@
+"""Import-time profile of the serving entry point.
+
+    python profile_startup.py             # slowest imports of `import app`
+    python profile_startup.py --ready     # + time until the data is loaded
+    python profile_startup.py --module dataset --top 30
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter
+and prints what that module imports directly, slowest first (cumulative
+time), so a heavy import that creeps back into app.py shows up here.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+READY_SNIPPET = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.get_data()
+done = time.perf_counter()
+print(f"import app: {imported - start:.2f}s, data ready after {done - start:.2f}s")
+"""
+
+
+def import_times(module):
+    # -> [(cumulative us, self us, package)] for every imported module
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        sys.exit(proc.stderr)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def report(module, top):
+    rows = import_times(module)
+    # -X importtime lists a module after everything it imported, indented
+    # two spaces per level: collect the direct imports of `module`
+    total, children, pending = 0, [], []
+    for cumulative, self_us, name in rows:
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == module:
+                total, children = cumulative, pending
+            pending = []
+        elif depth == 1:
+            pending.append((cumulative, self_us, name.strip()))
+
+    print(f"import {module}: {total / 1e6:.2f}s over {len(rows)} modules")
+    print(f"{'cumulative':>12}{'self':>10}  imported by {module}")
+    for cumulative, self_us, name in sorted(children, reverse=True)[:top]:
+        print(f"{cumulative / 1e3:>10.1f}ms{self_us / 1e3:>8.1f}ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Where does the app's start-up time go?")
+    parser.add_argument("--module", default="app", help="module to import (default: app)")
+    parser.add_argument("--top", type=int, default=15, help="how many packages to list")
+    parser.add_argument("--ready", action="store_true", help="also time the data warm-up")
+    args = parser.parse_args()
+
+    report(args.module, args.top)
+    if args.ready:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", READY_SNIPPET], check=True)
+        print(f"(whole process: {time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
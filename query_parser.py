@@ -0,0 +1,174 @@
+"""Structured parsing of the free-text search box.
+
+"Brooklyn 2022 pedestrian" used to be ORed token by token as substrings
+over every search column. QueryParser instead resolves each token against
+the vocabulary of each dimension (the distinct borough, year, vehicle,
+factor, injury and age-group values) and turns the query into per-dimension
+filters that go through the same FilterEngine path as the dropdowns:
+
+* tokens that resolve to the same dimension are ORed (brooklyn queens),
+  different dimensions are ANDed (brooklyn 2022);
+* a token is tried as an exact value (multi-word values like "staten
+  island" included), then an exact word of a value, then a prefix, then
+  within a small edit distance (typos); numbers only match exactly, so
+  "2022" is a year and never an age;
+* a word or prefix only counts when it is most of what it matches
+  (identifies): "brook" is Brooklyn and "unsafe" is Unsafe Speed, but
+  "pedestrian" does not pick the factor "Pedestrian/Bicyclist/Other
+  Pedestrian Error/Confusion", nor "car" "Outside Car Distraction";
+* when a token fits several dimensions at the same tier, the first one in
+  DIM_PRIORITY wins;
+* whatever does not resolve is kept as text and searched the old way.
+"""
+
+from bisect import bisect_left
+
+DIM_PRIORITY = ["borough", "year", "injury", "age_group", "vehicle", "factor"]
+STOPWORDS = {"and", "or", "in", "on", "at", "the", "of", "for", "with", "by"}
+MAX_SPAN = 4
+
+
+def normalize(text):
+    return str(text).lower().replace("–", "-").replace("—", "-").strip()
+
+
+def value_text(value):
+    # 2022.0 -> "2022"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return normalize(value)
+
+
+def within_distance(a, b, limit):
+    # Levenshtein distance <= limit (banded, stops early)
+    if abs(len(a) - len(b)) > limit:
+        return False
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+        if min(cur) > limit:
+            return False
+        prev = cur
+    return prev[-1] <= limit
+
+
+def identifies(part, text):
+    # a word (or prefix) stands for a value only if it is most of it
+    return len(part) >= 3 and 2 * len(part) >= len(text)
+
+
+class ParsedQuery:
+    def __init__(self, selections, text, matches):
+        self.selections = selections  # {dim: [values]}
+        self.text = text  # unresolved tokens, for the text fallback
+        self.matches = matches  # [(token, dim, values, how)]
+
+    def describe(self):
+        parts = [
+            f"{dim} = {', '.join(texts[:3])}"
+            + (f" (+{len(texts) - 3} more)" if len(texts) > 3 else "")
+            + (f" [{how} match for '{token}']" if how != "exact" else "")
+            for token, dim, texts, how in (
+                # "Bus" and "BUS" are both selected, but shown once
+                (token, dim, list(dict.fromkeys(value_text(v).upper() for v in values)), how)
+                for token, dim, values, how in self.matches
+            )
+        ]
+        if self.text:
+            parts.append(f"text '{self.text}'")
+        return "; ".join(parts)
+
+
+class QueryParser:
+    def __init__(self, vocabularies):
+        # vocabularies: {dim: iterable of column values}
+        self.exact = {}
+        self.words = {}
+        for dim, values in vocabularies.items():
+            for v in values:
+                if isinstance(v, float) and v != v:
+                    continue
+                v = v.item() if hasattr(v, "item") else v
+                text = value_text(v)
+                self.exact.setdefault(text, {}).setdefault(dim, []).append(v)
+                for word in text.replace("/", " ").split():
+                    if word != text and identifies(word, text):
+                        self.words.setdefault(word, {}).setdefault(dim, []).append(v)
+        self.keys = sorted(set(self.exact) | set(self.words))
+
+    def _lookup(self, key):
+        found = {}
+        for table in (self.exact, self.words):
+            for dim, values in table.get(key, {}).items():
+                found.setdefault(dim, []).extend(values)
+        return found
+
+    def _pick(self, found):
+        # one dimension per token: the first in DIM_PRIORITY
+        for dim in DIM_PRIORITY + sorted(found):
+            if dim in found:
+                return dim, list(dict.fromkeys(found[dim]))
+        return None, None
+
+    def _resolve_token(self, token):
+        if token in self.exact:
+            return self._pick(self.exact[token]) + ("exact",)
+        if token in self.words:
+            return self._pick(self.words[token]) + ("word",)
+        if token.isdigit() or len(token) < 3:
+            return None, None, None
+
+        # prefix: every key starting with the token
+        found = {}
+        i = bisect_left(self.keys, token)
+        while i < len(self.keys) and self.keys[i].startswith(token):
+            for dim, values in self._lookup(self.keys[i]).items():
+                # measured against the whole value, so "car" (a prefix of
+                # the word "carry") does not pick "Carry All"
+                found.setdefault(dim, []).extend(
+                    v for v in values if identifies(token, value_text(v))
+                )
+            i += 1
+        found = {dim: values for dim, values in found.items() if values}
+        if found:
+            return self._pick(found) + ("prefix",)
+
+        # typo: keys within 1 edit (2 for long tokens)
+        if len(token) >= 4:
+            limit = 1 if len(token) <= 6 else 2
+            for key in self.keys:
+                if not key[0].isdigit() and within_distance(token, key, limit):
+                    for dim, values in self._lookup(key).items():
+                        found.setdefault(dim, []).extend(values)
+            if found:
+                return self._pick(found) + ("fuzzy",)
+        return None, None, None
+
+    def parse(self, search_text):
+        tokens = [t for t in normalize(search_text or "").split() if t not in STOPWORDS]
+        selections, matches, leftover = {}, [], []
+
+        i = 0
+        while i < len(tokens):
+            # longest multi-word exact value first ("staten island")
+            for n in range(min(MAX_SPAN, len(tokens) - i), 1, -1):
+                span = " ".join(tokens[i:i + n])
+                if span in self.exact:
+                    token, (dim, values, how) = span, self._pick(self.exact[span]) + ("exact",)
+                    i += n
+                    break
+            else:
+                token = tokens[i]
+                dim, values, how = self._resolve_token(token)
+                i += 1
+
+            if dim is None:
+                leftover.append(token)
+                continue
+            current = selections.setdefault(dim, [])
+            current.extend(v for v in values if v not in current)
+            matches.append((token, dim, values, how))
+
+        return ParsedQuery(selections, " ".join(leftover), matches)
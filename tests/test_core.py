@@ -0,0 +1,166 @@
+"""Checks of the filter engine, the search parser and the cleaning pipeline
+against plain pandas.
+
+    python -m pytest tests
+"""
+
+import os
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_engine import FilterEngine
+from pipeline import clean_csv
+from query_parser import QueryParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VALUES = {
+    "a": list("abcdefghij"),
+    "b": [float(i) for i in range(30)],
+    "c": ["x", "y", "z"],
+    "d": ["p", "q", "r", "s"],
+}
+
+
+@pytest.fixture(scope="module")
+def frame():
+    # several rows per collision id: "d" is constant per collision (like the
+    # crash-level columns), "a" / "b" / "c" vary like person-level ones
+    rng = np.random.default_rng(1)
+    n = 20_000
+    ids = rng.integers(0, 6_000, n)
+    per_id = np.array(VALUES["d"], dtype=object)[rng.integers(0, 4, 6_000)]
+    df = pd.DataFrame(
+        {
+            "a": rng.choice(VALUES["a"], n),
+            "b": rng.integers(0, 30, n).astype(float),
+            "c": rng.choice(["x", "y", "z", None], n),
+            "d": per_id[ids],
+            "id": ids.astype(float),
+        }
+    )
+    df.loc[rng.random(n) < 0.01, "id"] = np.nan
+    return df
+
+
+def reference_mask(df, selections, search_text=""):
+    mask = np.ones(len(df), dtype=bool)
+    for dim, values in selections.items():
+        if values:
+            mask &= df[dim].isin(values).to_numpy()
+    tokens = search_text.lower().split()
+    if tokens:
+        hit = np.zeros(len(df), dtype=bool)
+        for col in ["a", "c"]:
+            text = df[col].astype(str).str.lower()
+            for token in tokens:
+                hit |= (text.str.contains(token, regex=False) & df[col].notna()).to_numpy()
+        mask &= hit
+    return mask
+
+
+def test_query_matches_pandas(frame):
+    # small random steps, so the narrow / widen / cached paths all run
+    engine = FilterEngine(frame, {d: d for d in VALUES}, ["a", "c"], max_session_bytes=2**16)
+    rng = random.Random(2)
+    selections = {d: [] for d in VALUES}
+    modes = set()
+    for step in range(600):
+        dim = rng.choice(list(VALUES))
+        if selections[dim] and rng.random() < 0.5:
+            selections[dim] = selections[dim][:-1] if rng.random() < 0.7 else []
+        else:
+            value = rng.choice(VALUES[dim])
+            if value not in selections[dim]:
+                selections[dim] = selections[dim] + [value]
+        search = rng.choice(["", "", "", "a", "x b"])
+        session = rng.choice(["s1", "s1", "s2"])
+
+        pos, mode = engine.query(session, selections, search)
+        modes.add(mode)
+        expected = np.flatnonzero(reference_mask(frame, selections, search))
+        assert np.array_equal(pos, expected), (step, mode, selections, search)
+    assert {"full", "narrow", "widen", "cached"} <= modes
+
+
+@pytest.mark.parametrize(
+    "selections, search_text, fixed",
+    [
+        ({}, "", None),
+        ({"a": ["a", "b"]}, "", None),
+        ({"d": ["p"], "b": [3.0, 4.0]}, "y", None),
+        ({"c": ["x"]}, "", {"a": ["c"]}),
+        ({"a": ["a"], "d": ["q", "r"]}, "e z", {"d": ["q"]}),
+    ],
+)
+def test_facet_counts_match_pandas(frame, selections, search_text, fixed):
+    engine = FilterEngine(frame, {d: d for d in VALUES}, ["a", "c"], count_col="id")
+    counts = engine.facet_counts(selections, search_text, fixed=fixed)
+
+    for dim, values in VALUES.items():
+        # every other filter, this dimension's own selection left out
+        others = {d: v for d, v in selections.items() if d != dim}
+        base = reference_mask(frame, others, search_text)
+        for d, v in (fixed or {}).items():
+            base &= frame[d].isin(v).to_numpy()
+        rows = frame[base & frame[dim].notna().to_numpy()]
+        expected = rows.dropna(subset=["id"]).groupby(dim)["id"].nunique()
+        for value in values:
+            assert counts[dim].get(value, 0) == expected.get(value, 0), (dim, value)
+
+
+@pytest.fixture(scope="module")
+def parser():
+    crashes = pd.read_csv(os.path.join(ROOT, "sample_crashes.csv"), low_memory=False)
+    return QueryParser(
+        {
+            "borough": crashes["borough"].dropna().unique(),
+            "year": crashes["crash_year"].dropna().unique(),
+            "vehicle": list(crashes["vehicle_type_code_1"].dropna().unique()) + ["Bus", "BUS"],
+            "factor": crashes["contributing_factor_vehicle_1"].dropna().unique(),
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "query, selections, text",
+    [
+        ("Brooklyn 2022 pedestrian", {"borough": ["BROOKLYN"], "year": [2022.0]}, "pedestrian"),
+        ("brooklyn queens", {"borough": ["BROOKLYN", "QUEENS"]}, ""),
+        ("staten island glare", {"borough": ["STATEN ISLAND"], "factor": ["Glare"]}, ""),
+        ("brook", {"borough": ["BROOKLYN"]}, ""),
+        ("brookyln", {"borough": ["BROOKLYN"]}, ""),
+        ("unsafe speed", {"factor": ["Unsafe Speed"]}, ""),
+        ("driver", {}, "driver"),
+        ("outside car", {}, "outside car"),
+        ("car", {}, "car"),
+        ("the bronx and nothingmatches", {"borough": ["BRONX"]}, "nothingmatches"),
+    ],
+)
+def test_parser(parser, query, selections, text):
+    parsed = parser.parse(query)
+    assert {d: sorted(v) for d, v in parsed.selections.items()} == {
+        d: sorted(v) for d, v in selections.items()
+    }
+    assert parsed.text == text
+
+
+def test_parser_describes_case_variants_once(parser):
+    parsed = parser.parse("bus")
+    assert sorted(parsed.selections["vehicle"]) == ["BUS", "Bus"]
+    assert parsed.describe() == "vehicle = BUS"
+
+
+@pytest.mark.parametrize("kind", ["crashes", "persons"])
+def test_clean_csv_same_with_workers(tmp_path, kind):
+    src = os.path.join(ROOT, f"sample_{kind}.csv")
+    serial = tmp_path / "serial.csv"
+    parallel = tmp_path / "parallel.csv"
+    # small chunks so duplicates and the age medians span chunk borders
+    clean_csv(kind, src, str(serial), chunksize=97, workers=1)
+    clean_csv(kind, src, str(parallel), chunksize=97, workers=2)
+    pd.testing.assert_frame_equal(
+        pd.read_csv(serial, low_memory=False), pd.read_csv(parallel, low_memory=False)
+    )
@@ -0,0 +1,258 @@
+"""Multi-resolution time rollups for the crashes-over-time chart.
+
+Every row gets a bucket code per level (year / month / week / day) once.
+For each level, and for each FilterEngine dimension, distinct-collision
+counts per (value, bucket) are rolled up the first time they are needed
+and kept, so the common cases (no filter, or one value of one dimension)
+are answered by slicing a precomputed rollup. Everything else falls back
+to a bincount of the filtered rows over the precomputed bucket codes -
+no groupby over raw rows at query time either way.
+
+A window (`start`, `end`) keeps only the buckets whose start lies in
+[start, end), which is what the chart drills into.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from filter_engine import distinct, distinct_counts
+
+LEVELS = ["year", "month", "week", "day"]
+FINER = {"year": "month", "month": "week", "week": "day"}
+STEP = {
+    "year": pd.DateOffset(years=1),
+    "month": pd.DateOffset(months=1),
+    "week": pd.DateOffset(days=7),
+    "day": pd.DateOffset(days=1),
+}
+# (values x buckets) above this are counted by sorting, not a bincount
+BINCOUNT_LIMIT = 50_000_000
+
+
+def bucket_days(days, level):
+    # days: datetime64[D] -> start day of the bucket (weeks start on Monday)
+    if level == "year":
+        return days.astype("datetime64[Y]").astype("datetime64[D]")
+    if level == "month":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    if level == "week":
+        n = days.astype(np.int64)
+        # 1970-01-01 was a Thursday
+        return (n - (n + 3) % 7).astype("datetime64[D]")
+    return days
+
+
+def drill_window(level, period_start):
+    # the period a clicked point covers, as an ISO [start, end) window
+    start = pd.Timestamp(period_start).normalize()
+    return [start.date().isoformat(), (start + STEP[level]).date().isoformat()]
+
+
+class TimeRollups:
+    def __init__(self, dates, engine):
+        self.engine = engine
+        days = pd.to_datetime(dates, errors="coerce").to_numpy().astype("datetime64[D]")
+        self.valid = ~np.isnat(days)
+
+        # day code per row through a bincount over the (few thousand) days
+        # spanned, then each level maps the distinct days to its buckets
+        n = days[self.valid].astype(np.int64)
+        lo = n.min() if len(n) else 0
+        present = np.bincount(n - lo) > 0
+        day_starts = (np.flatnonzero(present) + lo).astype("datetime64[D]")
+        day_codes = np.full(len(days), -1, dtype=np.int32)
+        day_codes[self.valid] = (np.cumsum(present) - 1)[n - lo]
+
+        # per level: bucket code per row (-1 = no date) + bucket start days
+        self.codes = {}
+        self.starts = {}
+        self.of_day = {}  # level -> bucket code of each distinct day
+        for level in LEVELS:
+            starts, inv = np.unique(bucket_days(day_starts, level), return_inverse=True)
+            self.of_day[level] = inv.astype(np.int32)
+            codes = np.full(len(days), -1, dtype=np.int32)
+            codes[self.valid] = self.of_day[level][day_codes[self.valid]]
+            self.codes[level] = codes
+            self.starts[level] = starts
+
+        # day per collision when every row of a collision has the same date
+        # (the crash date of the crash x person frame): the rollups then
+        # count collisions directly instead of de-duplicating rows
+        self.count_days = None
+        count_index = engine.count_index
+        if count_index is not None:
+            has_id = count_index.codes >= 0
+            ids = count_index.codes[has_id]
+            day = day_codes[has_id]
+            per = np.full(len(count_index.uniques), -1, dtype=np.int32)
+            per[ids] = day
+            if np.array_equal(per[ids], day):
+                self.count_days = per
+
+        self._rollups = {}
+        self._pairs = {}
+        self._lock = threading.Lock()
+
+    # ---- counting helpers ----
+    def _count_buckets(self, level):
+        # bucket code per collision (-1 = no date)
+        dated = self.count_days >= 0
+        codes = np.full(len(self.count_days), -1, dtype=np.int32)
+        codes[dated] = self.of_day[level][self.count_days[dated]]
+        return codes
+
+    def _key_counts(self, keys, n_keys, buckets, level):
+        # counts per (key, bucket) -> (key codes, bucket codes, counts), sorted
+        nb = len(self.starts[level])
+        ok = buckets >= 0
+        if keys is not None:
+            ok &= keys >= 0
+        flat = buckets[ok].astype(np.int64)
+        if keys is not None:
+            flat += keys[ok].astype(np.int64) * nb
+        if n_keys * nb <= BINCOUNT_LIMIT:
+            counts = np.bincount(flat, minlength=n_keys * nb)
+            pairs = np.flatnonzero(counts)
+            counts = counts[pairs]
+        else:
+            pairs, counts = distinct_counts(flat)
+        return (
+            (pairs // nb).astype(np.int32),
+            (pairs % nb).astype(np.int32),
+            counts.astype(np.int32),
+        )
+
+    def _dim_pairs(self, dim):
+        # distinct (value code, collision code) of a person-level dim,
+        # shared by the four levels
+        with self._lock:
+            if dim in self._pairs:
+                return self._pairs[dim]
+        codes = self.engine.index[dim].codes
+        ids = self.engine.count_index.codes
+        keep = (codes >= 0) & (ids >= 0)
+        width = len(self.engine.count_index.uniques)
+        pairs = distinct(codes[keep].astype(np.int64) * width + ids[keep])
+        result = ((pairs // width).astype(np.int32), (pairs % width).astype(np.int32))
+        with self._lock:
+            self._pairs[dim] = result
+        return result
+
+    def _pair_counts(self, dim, level, pos=None):
+        # distinct collisions per (value of dim, bucket); dim None = all rows,
+        # pos = only these rows
+        engine = self.engine
+        n_keys = 1 if dim is None else len(engine.index[dim].uniques)
+        if self.count_days is not None:
+            per_bucket = self._count_buckets(level)
+            if pos is not None:
+                # bitmap of the collisions in `pos` (dim is None here)
+                ids = engine.count_index.codes[pos]
+                seen = np.zeros(len(per_bucket), dtype=bool)
+                seen[ids[ids >= 0]] = True
+                return self._key_counts(None, 1, per_bucket[seen], level)
+            if dim is None:
+                return self._key_counts(None, 1, per_bucket, level)
+            if dim in engine.per_count:
+                return self._key_counts(engine.per_count[dim], n_keys, per_bucket, level)
+            keys, ids = self._dim_pairs(dim)
+            return self._key_counts(keys, n_keys, per_bucket[ids], level)
+
+        # general case: distinct (key, bucket, collision) over the rows
+        buckets = self.codes[level] if pos is None else self.codes[level][pos]
+        keys = None
+        if dim is not None:
+            keys = engine.index[dim].codes if pos is None else engine.index[dim].codes[pos]
+        if engine.count_index is None:
+            return self._key_counts(keys, n_keys, buckets, level)
+        nb = len(self.starts[level])
+        ids = engine.count_index.codes if pos is None else engine.count_index.codes[pos]
+        ok = (buckets >= 0) & (ids >= 0)
+        if keys is not None:
+            ok &= keys >= 0
+        kb = buckets[ok].astype(np.int64)
+        if keys is not None:
+            kb += keys[ok].astype(np.int64) * nb
+        width = len(engine.count_index.uniques)
+        kb = distinct(kb * width + ids[ok]) // width
+        return self._key_counts(kb // nb, n_keys, kb % nb, level)
+
+    def rollup(self, dim, level):
+        """(value codes, bucket codes, counts) for one dimension (None = all rows)."""
+        key = (dim, level)
+        with self._lock:
+            if key in self._rollups:
+                return self._rollups[key]
+        result = self._pair_counts(dim, level)
+        with self._lock:
+            self._rollups[key] = result
+        return result
+
+    def warm(self):
+        # every rollup the chart can ask for, built up front (while loading)
+        for level in LEVELS:
+            self.rollup(None, level)
+            for dim in self.engine.index:
+                self.rollup(dim, level)
+        # the (value, collision) pairs were only needed to build them
+        with self._lock:
+            self._pairs.clear()
+
+    def _window(self, level, buckets, window):
+        if not window:
+            return np.ones(len(buckets), dtype=bool)
+        starts = self.starts[level][buckets]
+        start, end = window
+        keep = np.ones(len(buckets), dtype=bool)
+        if start is not None:
+            keep &= starts >= np.datetime64(pd.Timestamp(start).date(), "D")
+        if end is not None:
+            keep &= starts < np.datetime64(pd.Timestamp(end).date(), "D")
+        return keep
+
+    # ---- public API ----
+    def series(self, level, selections=None, search_text="", window=None, pos=None):
+        """(DataFrame(period, crash_count), source) for one level, optionally windowed.
+
+        source is "rollup" or "rows" (counted from the filtered rows).
+
+        `pos` are the already filtered row positions; they are only used
+        when the selection cannot be served from a rollup.
+        """
+        state = self.engine.normalize(selections)
+        search = " ".join((search_text or "").split())
+
+        if not search and not state:
+            _, buckets, counts = self.rollup(None, level)
+            source = "rollup"
+        elif not search and len(state) == 1 and len(next(iter(state.values()))) == 1:
+            dim, codes = next(iter(state.items()))
+            code = next(iter(codes))
+            values, buckets, counts = self.rollup(dim, level)
+            lo, hi = np.searchsorted(values, [code, code + 1])
+            buckets, counts = buckets[lo:hi], counts[lo:hi]
+            source = "rollup"
+        else:
+            if pos is None:
+                pos, _ = self.engine.query(None, selections, search_text)
+            if window:
+                # only the rows of the window's buckets are counted
+                codes = self.codes[level][pos]
+                in_window = codes >= 0
+                in_window[in_window] = self._window(level, codes[in_window], window)
+                pos = pos[in_window]
+            _, buckets, counts = self._pair_counts(None, level, pos)
+            source = "rows"
+
+        keep = self._window(level, buckets, window)
+        return (
+            pd.DataFrame(
+                {
+                    "period": self.starts[level][buckets[keep]],
+                    "crash_count": counts[keep],
+                }
+            ),
+            source,
+        )